@@ -0,0 +1,233 @@
+import json
+import logging
+import math
+import os
+import platform
+import random
+import tempfile
+import timeit
+from contextlib import contextmanager
+from copy import deepcopy
+
+import solitaire_spy.solver.core as core
+from solitaire_spy.constants import *
+from solitaire_spy.deck import build_deck, load_deck_spec
+from solitaire_spy.log import get_logger
+from solitaire_spy.mtg_engine import GameLostException
+from solitaire_spy.solver.core import Solver
+from solitaire_spy.solver.simulator import Simulator
+from solitaire_spy.spy_solitaire import MTGSolitaire
+
+log = get_logger(__name__, log_format="%(message)s", stdout_level=logging.INFO)
+
+BENCHMARK_DECKS = {
+    "stock": STOCK_DECK_PATH,
+    "base": BASE_DECK_PATH,
+    "rumble": RUMBLE_DECK_PATH,
+}
+BENCHMARK_SEEDS = range(20)  # one seeded library per seed and deck
+PLAYOUT_STEPS = 60  # random steps played from each library to collect game states
+MICRO_REPEAT = 5  # micro-benchmarks report the best of these runs
+MICRO_MIN_SECONDS = 0.2
+SOLVE_SEEDS = range(8)
+SOLVE_RUNTIME = 20  # seconds, per Solver.solve
+SIMULATOR_NUM_SIM = 16
+SIMULATOR_RUNTIME = 20  # seconds, per simulated game
+REGRESSION_THRESHOLD = 1.20  # slower than the baseline by more than 20%
+
+
+@contextmanager
+def max_solver_runtime(seconds):
+    # the solver reads MAX_SOLVER_RUNTIME from its module: forked workers inherit it too
+    previous = core.MAX_SOLVER_RUNTIME
+    core.MAX_SOLVER_RUNTIME = seconds
+    try:
+        yield
+    finally:
+        core.MAX_SOLVER_RUNTIME = previous
+
+
+def new_game(deck_spec, seed):
+    random.seed(seed)
+    return MTGSolitaire(build_deck(deck_spec), None)
+
+
+def collect_states(deck_spec, seeds=BENCHMARK_SEEDS, steps=PLAYOUT_STEPS):
+    # seeded random playouts: the same decks always give the same states
+    states = []
+    for seed in seeds:
+        env = new_game(deck_spec, seed)
+        rng = random.Random(seed)
+        for _ in range(steps):
+            states.append(deepcopy(env))
+            possible_actions = env.engine.get_possible_actions()
+            card, action = rng.choice(possible_actions)
+            try:
+                env.step(card, action)
+            except GameLostException:
+                break
+            if env.opponent_counter_life <= 0:
+                break
+    return states
+
+
+def _time_best_of(function, repeat=MICRO_REPEAT):
+    # seconds per call: calls are batched to last at least MICRO_MIN_SECONDS
+    start_time = timeit.default_timer()
+    function()  # also warms up caches
+    number = max(1, math.ceil(MICRO_MIN_SECONDS / (timeit.default_timer() - start_time)))
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = timeit.default_timer()
+        for _ in range(number):
+            function()
+        best = min(best, (timeit.default_timer() - start_time) / number)
+    return best
+
+
+def _get_result(seconds, ops):
+    return {"seconds": seconds, "ops": ops, "us_per_op": seconds / ops * 1e6 if ops else 0}
+
+
+def run_micro_benchmarks(states):
+    results = {}
+    possible_actions = [env.engine.get_possible_actions() for env in states]
+    solver = Solver(deepcopy(states[0]))
+
+    def actions():
+        for env in states:
+            env.engine.get_possible_actions()
+
+    def copies():
+        for env in states:
+            deepcopy(env)
+
+    def hashes():
+        for env in states:
+            env.functional_hash
+
+    def heuristics():
+        for env, env_actions in zip(states, possible_actions):
+            solver._get_obvious_action(env, env_actions)
+
+    results["get_possible_actions"] = _get_result(_time_best_of(actions), len(states))
+    results["deepcopy"] = _get_result(_time_best_of(copies), len(states))
+    results["functional_hash"] = _get_result(_time_best_of(hashes), len(states))
+    results["heuristics"] = _get_result(_time_best_of(heuristics), len(states))
+
+    # step: the first action of every state, on fresh copies prepared beforehand
+    best = float("inf")
+    steps = 0
+    for _ in range(2 * MICRO_REPEAT):
+        envs = [deepcopy(env) for env in states]
+        actions_to_step = [env.engine.get_possible_actions()[0] for env in envs]
+        steps = 0
+        start_time = timeit.default_timer()
+        for env, (card, action) in zip(envs, actions_to_step):
+            try:
+                env.step(card, action)
+            except GameLostException:
+                pass
+            steps += 1
+        best = min(best, timeit.default_timer() - start_time)
+    results["step"] = _get_result(best, steps)
+    return results
+
+
+def run_solve_benchmark(deck_spec, seeds=SOLVE_SEEDS, runtime=SOLVE_RUNTIME):
+    outcomes = []
+    start_time = timeit.default_timer()
+    with max_solver_runtime(runtime):
+        for seed in seeds:
+            env = new_game(deck_spec, seed)
+            solver_start_time = timeit.default_timer()
+            result, env = Solver(env).solve(
+                early_abort=False,
+                start_time=solver_start_time,
+                with_lucky_wins=False,
+                initial_hand_size=INITIAL_HAND_SIZE,
+            )
+            outcomes.append({
+                "seed": seed,
+                "result": result,
+                "turn": env.counter_turn if env else None,
+                "seconds": timeit.default_timer() - solver_start_time,
+            })
+    result = _get_result(timeit.default_timer() - start_time, len(outcomes))
+    result["outcomes"] = outcomes
+    return result
+
+
+def run_simulator_benchmark(deck_spec, num_sim=SIMULATOR_NUM_SIM, runtime=SIMULATOR_RUNTIME):
+    # game i is seeded with SEED + i in its own process: every run plays the same games
+    with tempfile.TemporaryDirectory() as results_path, max_solver_runtime(runtime):
+        simulator = Simulator(
+            deck_spec,
+            num_sim,
+            with_lucky_wins=False,
+            initial_hand_size=INITIAL_HAND_SIZE,
+            results_path=f"{results_path}/",
+            seed=SEED,
+        )
+        start_time = timeit.default_timer()
+        simulator.simulate(load_existing=False)
+        return _get_result(timeit.default_timer() - start_time, len(simulator.summaries))
+
+
+def run_benchmarks(decks=BENCHMARK_DECKS, with_macro=True):
+    benchmarks = {}
+    for deck_name, deck_file in decks.items():
+        deck_spec = load_deck_spec(deck_file)
+        states = collect_states(deck_spec)
+        log.info(f"{deck_name}: {len(states)} game states")
+        for name, result in run_micro_benchmarks(states).items():
+            benchmarks[f"{deck_name}.{name}"] = result
+        if with_macro:
+            benchmarks[f"{deck_name}.solve"] = run_solve_benchmark(deck_spec)
+    if with_macro:
+        benchmarks["stock.simulator"] = run_simulator_benchmark(load_deck_spec(STOCK_DECK_PATH))
+    for name, result in benchmarks.items():
+        log.info(f"{name}: {result['us_per_op']:.1f} us/op ({result['ops']} ops, {result['seconds']:.3f} s)")
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": benchmarks,
+    }
+
+
+def compare_with_baseline(results, baseline):
+    # returns the benchmarks slower than the baseline, as {name: current / baseline}
+    regressions = {}
+    for name, result in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        baseline_us = baseline["benchmarks"][name]["us_per_op"]
+        if not baseline_us:
+            continue
+        ratio = result["us_per_op"] / baseline_us
+        log.info(f"{name}: {ratio:.2f}x baseline")
+        if ratio > REGRESSION_THRESHOLD:
+            regressions[name] = ratio
+    return regressions
+
+
+def main(output_file=f"{BENCHMARKS_PATH}latest.json", baseline_file=f"{BENCHMARKS_PATH}baseline.json",
+         with_macro=True):
+    results = run_benchmarks(with_macro=with_macro)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=2)
+    log.info(f"Benchmark results saved into {output_file}")
+    if not os.path.exists(baseline_file):
+        log.info(f"No baseline found: save {output_file} as {baseline_file} to compare against it")
+        return results, {}
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline)
+    for name, ratio in regressions.items():
+        log.warning(f"Regression: {name} is {ratio:.2f}x slower than the baseline")
+    return results, regressions
+
+
+if __name__ == '__main__':
+    main()
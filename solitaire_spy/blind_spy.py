@@ -3,9 +3,14 @@ import json
 import os
 import random
 
-from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from math import comb
 
-random.seed(42)
+import numpy as np
+
+SEED = 42
 
 # Change this parameter if you want to try different deck builds. I've tried [39, 42].
 STARTING_CREATURES_IN_DECK = 41
@@ -25,7 +30,9 @@ MIN_CREATURES_IN_DECK = 17  # non-Spy, non-Giant creatures
 
 CARDS_IN_DECK = 60
 NUM_SIM = 1000000
-SIM_THREADS = 8
+SIM_WORKERS = 8
+BATCH_SIZE = 100000  # decks shuffled at once by the vectorized engine
+BLIND_SPY_TABLE_PATH = "../resources/blind_spy/blind_spy_table.npy"
 
 # LEGEND:
 # L = LAND [IN DECK]
@@ -38,6 +45,10 @@ SIM_THREADS = 8
 # BC = CREATURE ON THE BATTLEFIELD (non-Spy, non-Giant)
 # DC = CREATURE IN DECK (non-Spy, non-Giant)
 
+# integer encoding of the tokens above, used by the vectorized engine
+TOKENS = ["L", "DR", "G", "DS", "DC"]
+L, DR, G, DS, DC = range(len(TOKENS))
+
 
 def generate_configs():
     configs = []
@@ -126,10 +137,117 @@ def _go_blind(creatures_on_board, deck):
     return True, expanded_gy.count("DC") + expanded_gy.count("G") + expanded_gy.count("DS") + 5 - 1  # board is sacced, 1 creature left on the battlefield
 
 
+def _go_blind_batch(creatures_on_board, decks):
+    # Same rules as _go_blind, applied at once to a (num_decks, cards) matrix of
+    # shuffled decks encoded with TOKENS. Returns the damage of each deck.
+    num_decks, cards = decks.shape
+    positions = np.arange(cards)
+    is_land = decks == L
+    land_index = is_land.argmax(axis=1)
+    milled = positions <= land_index[:, None]  # land is milled
+
+    def milled_count(token):
+        return np.count_nonzero((decks == token) & milled, axis=1)
+
+    drs_milled = milled_count(DR)
+    giants_milled = milled_count(G)
+    spies_milled = milled_count(DS)
+    all_creatures_in_gy = milled_count(DC) + giants_milled + spies_milled
+    giant_damage = all_creatures_in_gy - 1 + 3  # -G to reanimate +3 creatures to sac
+
+    # the deck composition is the same for every row
+    lands_remaining = np.count_nonzero(is_land[0]) - 1
+    all_creatures_in_deck = np.count_nonzero(decks[0] >= G)  # G, DS, DC
+    # board is sacced, 1 creature left on the battlefield
+    full_mill_damage = all_creatures_in_deck + 5 - 1
+
+    expanded_gy_damage = np.zeros(num_decks, dtype=np.int64)
+    if lands_remaining > 0:
+        # as in _go_blind, the index is relative to the remaining deck but it is
+        # used to slice the whole deck
+        other_land_index = (is_land & ~milled).argmax(axis=1) - land_index - 1
+        expanded_gy = positions <= other_land_index[:, None]  # land is milled
+        expanded_gy_damage = np.count_nonzero((decks >= G) & expanded_gy, axis=1) + 5 - 1
+
+    no_dr = drs_milled == 0
+    small_board = np.full(num_decks, creatures_on_board < 5)
+    big_board = ~small_board
+    no_giant = giants_milled == 0
+    no_spy = spies_milled == 0
+    double_combo = (drs_milled == 2) & (giants_milled == 2)
+    double_damage = 2 * giant_damage + 2
+    conditions = [
+        no_dr,  # land milled before DR
+        small_board & no_giant,  # condition A
+        small_board & ~no_giant,  # condition B
+        big_board & no_giant & no_spy,  # condition C
+        big_board & double_combo & no_spy,  # condition D
+        big_board & ~no_giant & no_spy,  # condition E
+        big_board & (lands_remaining == 1) & (drs_milled == 1) & ~no_giant,  # condition F
+        big_board & (lands_remaining == 0) & double_combo & ~no_spy,  # condition G
+        big_board & (lands_remaining == 0),  # condition H
+        big_board & (lands_remaining == 1) & double_combo & ~no_spy,  # condition I
+    ]
+    choices = [
+        0,
+        0,
+        giant_damage,
+        0,
+        double_damage,
+        giant_damage,
+        giant_damage,
+        np.where(double_damage > STARTING_CREATURES_IN_DECK - 1, double_damage, full_mill_damage),
+        full_mill_damage,
+        np.where(double_damage >= 20, double_damage, expanded_gy_damage),
+    ]
+    return np.select(conditions, choices, default=expanded_gy_damage)  # condition L
+
+
+def _get_config_rng(config):
+    # one independent stream per config: results do not depend on worker scheduling.
+    # Runs are reproducible, but their decks differ from those of the former
+    # random.shuffle loop: distributions match it statistically, not game by game
+    return np.random.default_rng([SEED, *config])
+
+
+def shuffled_decks(deck, num_decks, rng):
+    return rng.permuted(np.tile(deck, (num_decks, 1)), axis=1)
+
+
+def simulate_damages(config, num_sim=NUM_SIM):
+    lands_in_deck, creatures_on_board, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck = config
+    deck = np.array(
+        lands_in_deck * [L] + drs_in_deck * [DR] + giants_in_deck * [G] + spies_in_deck * [DS] + creatures_in_deck * [DC],
+        dtype=np.int8,
+    )
+    rng = _get_config_rng(config)
+    damages = []
+    for batch_start in range(0, num_sim, BATCH_SIZE):
+        decks = shuffled_decks(deck, min(BATCH_SIZE, num_sim - batch_start), rng)
+        damages.append(_go_blind_batch(creatures_on_board, decks))
+    return np.concatenate(damages)
+
+
+def check_go_blind_batch(config, num_decks=10000):
+    # the vectorized engine must agree with _go_blind deck by deck
+    lands_in_deck, creatures_on_board, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck = config
+    deck = np.array(
+        lands_in_deck * [L] + drs_in_deck * [DR] + giants_in_deck * [G] + spies_in_deck * [DS] + creatures_in_deck * [DC],
+        dtype=np.int8,
+    )
+    decks = shuffled_decks(deck, num_decks, _get_config_rng(config))
+    damages = _go_blind_batch(creatures_on_board, decks)
+    for row, damage in zip(decks, damages):
+        _, expected_damage = _go_blind(creatures_on_board, [TOKENS[t] for t in row])
+        if damage != expected_damage:
+            return False
+    return True
+
+
 def blind_spy_double_dr(config):
     lands_in_deck, creatures_on_board, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck = config
     signature = f"{creatures_on_board}BC_{lands_in_deck}L_{drs_in_deck}DR_{giants_in_deck}G_{spies_in_deck}DS_{creatures_in_deck}DC"
-    result_file = f"../resources/blind_spy/double_dr/blind_spy_{signature}_{NUM_SIM}.csv"
+    result_file = f"../resources/blind_spy/double_dr/blind_spy_{signature}_{NUM_SIM}.npz"
     print(result_file)
     if os.path.isfile(result_file):  # simulation already executed, skip it
         return
@@ -138,29 +256,13 @@ def blind_spy_double_dr(config):
     print(f"Total: {lands_in_deck + drs_in_deck + giants_in_deck + spies_in_deck + creatures_in_deck} relevant cards in deck")
     print(config)
     # due to input config constraints, single-DR win is always possible (at least 1 Giant, DR, and 17 creatures in deck)
-    deck = lands_in_deck * ["L"] + drs_in_deck * ["DR"] + giants_in_deck * ["G"] + spies_in_deck * ["DS"] + creatures_in_deck * ["DC"]
-    with open(result_file, "w") as out_f:
-        out_f.write(
-            "creatures_on_board,"
-            "lands_in_deck,"
-            "drs_in_deck,"
-            "giants_in_deck,"
-            "spies_in_deck,"
-            "creatures_in_deck,"
-            "damage\n"
-        )
-        for _ in range(NUM_SIM):
-            random.shuffle(deck)
-            _, damage = _go_blind(creatures_on_board, deck)
-            out_f.write(
-                f"{creatures_on_board},"
-                f"{lands_in_deck},"
-                f"{drs_in_deck},"
-                f"{giants_in_deck},"
-                f"{spies_in_deck},"
-                f"{creatures_in_deck},"
-                f"{damage}\n"
-            )
+    damages = simulate_damages(config)
+    # one histogram per config: damage_histogram[d] is the number of games dealing d damage
+    np.savez_compressed(
+        result_file,
+        config=np.array(config),
+        damage_histogram=np.bincount(damages),
+    )
     # success_count, fail_count = 0, 0
     # damages = []
     # win = 100 * success_count / NUM_SIM
@@ -180,7 +282,7 @@ def blind_spy_double_dr(config):
 def simulate_double_dr():
     configs = generate_configs()
     print(f"Simulating {len(configs)} configs...")
-    with ThreadPoolExecutor(max_workers=SIM_THREADS) as executor:
+    with ProcessPoolExecutor(max_workers=SIM_WORKERS) as executor:
         results = list(
             executor.map(
                 blind_spy_double_dr,
@@ -190,37 +292,261 @@ def simulate_double_dr():
     return results
 
 
+def _get_config_dict(config):
+    lands_in_deck, creatures_on_board, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck = config
+    return {
+        "creatures_on_board": creatures_on_board,
+        "lands_in_deck": lands_in_deck,
+        "drs_in_deck": drs_in_deck,
+        "giants_in_deck": giants_in_deck,
+        "spies_in_deck": spies_in_deck,
+        "creatures_in_deck": creatures_in_deck,
+    }
+
+
+def _get_at_least(damage_histogram, size):
+    # damage_histogram[d] is the number of games (or the probability) dealing d damage,
+    # at_least[x] is the number of games dealing x or more damage
+    at_least = np.zeros(max(len(damage_histogram), size), dtype=damage_histogram.dtype)
+    at_least[:len(damage_histogram)] = damage_histogram
+    return at_least[::-1].cumsum()[::-1]
+
+
+def _get_record(config, damage_histogram, total, scale=1):
+    thresholds = range(3, 2 * STARTING_CREATURES_IN_DECK + 1)
+    at_least = _get_at_least(damage_histogram, thresholds.stop)
+    record = dict(config)
+    for x in thresholds:
+        at_least_x_damage = at_least[x].item()
+        record[f"damage_{x}"] = at_least_x_damage * scale
+        record[f"win_{x}%"] = at_least_x_damage / total
+        record[f"lose_{x}%"] = 1 - record[f"win_{x}%"]
+    return record
+
+
+def _load_csv_histogram(file_name):
+    # results written before histograms were introduced: one row per game
+    with open(file_name) as f:
+        reader = csv.DictReader(f)
+        first_row = next(reader)
+        config = tuple(int(first_row[k]) for k in (
+            "lands_in_deck", "creatures_on_board", "drs_in_deck", "giants_in_deck", "spies_in_deck", "creatures_in_deck"
+        ))
+        damages = [int(first_row["damage"])] + [int(row["damage"]) for row in reader]
+    return config, np.bincount(damages)
+
+
 def consolidate_double_dr():
     source_dir = "../resources/blind_spy/double_dr"
-    config_fields = ["creatures_on_board", "lands_in_deck", "drs_in_deck", "giants_in_deck", "spies_in_deck", "creatures_in_deck"]
     records = []
     for filename in sorted(os.listdir(source_dir)):
-        if not filename.endswith(".csv"):
+        file_name = os.path.join(source_dir, filename)
+        if filename.endswith(".npz"):
+            with np.load(file_name) as data:
+                config = tuple(data["config"].tolist())
+                damage_histogram = data["damage_histogram"]
+        elif filename.endswith(".csv"):
+            config, damage_histogram = _load_csv_histogram(file_name)
+        else:
             continue
-        with open(os.path.join(source_dir, filename)) as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)
-        total = len(rows)
-        damage_values = [int(row["damage"]) for row in rows]
-        config = {k: int(rows[0][k]) for k in config_fields}
-        freq = {}
-        for d in damage_values:
-            freq[d] = freq.get(d, 0) + 1
-        record = dict(config)
-        for x in range(3, 2 * STARTING_CREATURES_IN_DECK + 1):
-            at_least_x_damage = [d for d in damage_values if d >= x]
-            record[f"damage_{x}"] = len(at_least_x_damage)
-            record[f"win_{x}%"] = len(at_least_x_damage) / total
-            record[f"lose_{x}%"] = 1 - record[f"win_{x}%"]
-        records.append(record)
+        total = int(damage_histogram.sum())
+        records.append(_get_record(_get_config_dict(config), damage_histogram, total))
     output_file = "../resources/blind_spy/blind_spy_full_consolidated.json"
     with open(output_file, "w") as f:
         json.dump(records, f, indent=2)
     print(f"Consolidated {len(records)} records into {output_file}")
 
 
+def _blind_outcome(creatures_on_board, lands_remaining, drs_milled, giants_milled, spies_milled, all_creatures_in_gy, all_creatures_in_deck):
+    # _go_blind on card counts: returns the damage, or None when the damage is
+    # given by the expanded graveyard (i.e. it depends on where the second land is)
+    giant_damage = all_creatures_in_gy - 1 + 3  # -G to reanimate +3 creatures to sac
+    double_damage = 2 * giant_damage + 2
+    full_mill_damage = all_creatures_in_deck + 5 - 1
+    if drs_milled == 0:
+        return 0
+    if creatures_on_board < 5:  # conditions A and B
+        return giant_damage if giants_milled > 0 else 0
+    if giants_milled == 0 and spies_milled == 0:  # condition C
+        return 0
+    if drs_milled == 2 and giants_milled == 2 and spies_milled == 0:  # condition D
+        return double_damage
+    if giants_milled > 0 and spies_milled == 0:  # condition E
+        return giant_damage
+    if lands_remaining == 1 and drs_milled == 1 and giants_milled > 0:  # condition F
+        return giant_damage
+    if lands_remaining == 0 and drs_milled == 2 and giants_milled == 2 and spies_milled > 0:  # condition G
+        return double_damage if double_damage > STARTING_CREATURES_IN_DECK - 1 else full_mill_damage
+    if lands_remaining == 0:  # condition H
+        return full_mill_damage
+    if lands_remaining == 1 and drs_milled == 2 and giants_milled == 2 and spies_milled > 0 and double_damage >= 20:
+        return double_damage  # condition I, case a
+    return None  # condition I (cases b and c) and condition L
+
+
+@lru_cache(maxsize=None)
+def _hypergeometric(population, successes, draws):
+    return tuple(
+        (x, comb(successes, x) * comb(population - successes, draws - x) / comb(population, draws))
+        for x in range(max(0, draws - population + successes), min(draws, successes) + 1)
+    )
+
+
+@lru_cache(maxsize=None)
+def _expanded_gy_creatures(cards, lands, all_creatures, land_index, creatures_in_gy):
+    # Distribution of the creatures in deck[:other_land_index + 1], where the first
+    # land is at land_index and other_land_index is relative to the remaining deck
+    # (see condition L in _go_blind)
+    remaining = cards - land_index - 1
+    lands_remaining = lands - 1
+    non_lands_remaining = remaining - lands_remaining
+    creatures_remaining = all_creatures - creatures_in_gy
+    distribution = defaultdict(float)
+    for gap in range(non_lands_remaining + 1):  # non-lands between first and second land
+        p_gap = comb(remaining - gap - 1, lands_remaining - 1) / comb(remaining, lands_remaining)
+        if gap < land_index:  # only cards milled before the first land
+            for x, p in _hypergeometric(land_index, creatures_in_gy, gap + 1):
+                distribution[x] += p_gap * p
+        elif gap == land_index:  # exactly the cards milled with the first land
+            distribution[creatures_in_gy] += p_gap
+        else:  # also the first cards after the first land
+            for x, p in _hypergeometric(non_lands_remaining, creatures_remaining, gap - land_index):
+                distribution[creatures_in_gy + x] += p_gap * p
+    return distribution
+
+
+def exact_damage_distribution(config, drs_in_graveyard=0):
+    # Every _go_blind outcome only depends on the composition of the deck before the
+    # first (and the second) land: enumerate these compositions with their
+    # multivariate hypergeometric probabilities instead of sampling shuffles.
+    # Dread Returns already in the graveyard can be flashed back as milled ones
+    # (up to MAX_DR_IN_DECK in all, as the strategies only play two).
+    lands_in_deck, creatures_on_board, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck = config
+    cards = lands_in_deck + drs_in_deck + giants_in_deck + spies_in_deck + creatures_in_deck
+    all_creatures_in_deck = giants_in_deck + spies_in_deck + creatures_in_deck
+    distribution = defaultdict(float)
+    for drs_milled in range(drs_in_deck + 1):
+        for giants_milled in range(giants_in_deck + 1):
+            for spies_milled in range(spies_in_deck + 1):
+                for creatures_milled in range(creatures_in_deck + 1):
+                    land_index = drs_milled + giants_milled + spies_milled + creatures_milled
+                    # the first land_index cards have this composition, then a land
+                    p = (
+                        comb(drs_in_deck, drs_milled) * comb(giants_in_deck, giants_milled) *
+                        comb(spies_in_deck, spies_milled) * comb(creatures_in_deck, creatures_milled) /
+                        comb(cards, land_index) * lands_in_deck / (cards - land_index)
+                    )
+                    all_creatures_in_gy = giants_milled + spies_milled + creatures_milled
+                    damage = _blind_outcome(
+                        creatures_on_board, lands_in_deck - 1, min(MAX_DR_IN_DECK, drs_milled + drs_in_graveyard),
+                        giants_milled,
+                        spies_milled, all_creatures_in_gy, all_creatures_in_deck,
+                    )
+                    if damage is not None:
+                        distribution[damage] += p
+                        continue
+                    expanded_gy = _expanded_gy_creatures(
+                        cards, lands_in_deck, all_creatures_in_deck, land_index, all_creatures_in_gy
+                    )
+                    for creatures, q in expanded_gy.items():
+                        # board is sacced, 1 creature left on the battlefield
+                        distribution[creatures + 5 - 1] += p * q
+    damage_histogram = np.zeros(max(distribution) + 1)
+    for damage, p in distribution.items():
+        damage_histogram[damage] = p
+    return damage_histogram
+
+
+def consolidate_double_dr_exact():
+    # same records as consolidate_double_dr, without sampling noise: damage_x is
+    # the expected number of games out of NUM_SIM
+    records = [
+        _get_record(_get_config_dict(config), exact_damage_distribution(config), 1, scale=NUM_SIM)
+        for config in generate_configs()
+    ]
+    output_file = "../resources/blind_spy/blind_spy_full_exact.json"
+    with open(output_file, "w") as f:
+        json.dump(records, f, indent=2)
+    print(f"Computed {len(records)} exact records into {output_file}")
+
+
+def validate_exact_against_monte_carlo(configs=None, num_sim=NUM_SIM, tolerance=0.005):
+    # returns the configs whose exact win rates differ from the simulated ones
+    mismatches = []
+    for config in configs or generate_configs():
+        config_dict = _get_config_dict(config)
+        exact_record = _get_record(config_dict, exact_damage_distribution(config), 1)
+        damage_histogram = np.bincount(simulate_damages(config, num_sim))
+        simulated_record = _get_record(config_dict, damage_histogram, num_sim)
+        error = max(
+            abs(exact_record[f"win_{x}%"] - simulated_record[f"win_{x}%"])
+            for x in range(3, 2 * STARTING_CREATURES_IN_DECK + 1)
+        )
+        if error > tolerance:
+            mismatches.append((config, error))
+    return mismatches
+
+
+def _get_table_shape():
+    # one axis per config field, indexed by its value, plus the damage threshold
+    return (
+        MAX_CREATURES_ON_BOARD + 1,
+        MAX_LANDS_IN_DECK + 1,
+        MAX_DR_IN_DECK + 1,
+        MAX_GIANT_IN_DECK + 1,
+        MAX_SPY_IN_DECK + 1,
+        STARTING_CREATURES_IN_DECK + 1,
+        2 * STARTING_CREATURES_IN_DECK + 2,
+    )
+
+
+def build_blind_spy_table(output_file=BLIND_SPY_TABLE_PATH):
+    # table[creatures_on_board, lands, drs, giants, spies, creatures, x] = P(damage >= x),
+    # NaN for configs outside generate_configs
+    table = np.full(_get_table_shape(), np.nan, dtype=np.float32)
+    for config in generate_configs():
+        lands_in_deck, creatures_on_board, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck = config
+        at_least = _get_at_least(exact_damage_distribution(config), table.shape[-1])
+        table[creatures_on_board, lands_in_deck, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck] = (
+            at_least[:table.shape[-1]]
+        )
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    np.save(output_file, table)
+    print(f"Saved {len(generate_configs())} configs into {output_file}")
+
+
+class BlindSpyTable:
+    def __init__(self, table_file=BLIND_SPY_TABLE_PATH):
+        # memory-mapped: pages are only read when a config is queried
+        self.table = np.load(table_file, mmap_mode="r")
+
+    def p_damage_at_least(self, x, creatures_on_board, lands_in_deck, drs_in_deck, giants_in_deck, spies_in_deck,
+                          creatures_in_deck):
+        # returns NaN if the config was not computed
+        if x <= 0:
+            return 1.0
+        shape = self.table.shape
+        index = (creatures_on_board, lands_in_deck, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck)
+        if any(i < 0 or i >= size for i, size in zip(index, shape)):
+            return float("nan")
+        if x >= shape[-1]:
+            return 0.0 if not np.isnan(self.table[index + (0,)]) else float("nan")
+        return float(self.table[index + (x,)])
+
+    def win_probability(self, opponent_life, config):
+        # config as in generate_configs and exact_damage_distribution: not in the table axis order
+        lands_in_deck, creatures_on_board, drs_in_deck, giants_in_deck, spies_in_deck, creatures_in_deck = config
+        return self.p_damage_at_least(
+            opponent_life, creatures_on_board, lands_in_deck, drs_in_deck, giants_in_deck, spies_in_deck,
+            creatures_in_deck,
+        )
+
+
 if __name__ == '__main__':
+    random.seed(SEED)
     # uncomment the task you want to run
     # simulate_double_dr()
     consolidate_double_dr()
+    # consolidate_double_dr_exact()
+    # build_blind_spy_table()
 
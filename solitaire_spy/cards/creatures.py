@@ -21,7 +21,7 @@ class TinderWall(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def sacrifice_for_mana_RR(self, env):
-        log.info(f"Sacrificing {self} for RR")
+        log.info("Sacrificing %s for RR", self)
         env.engine.sacrifice_creature(self)
         env.engine.add_mana('R', 2)
 
@@ -48,7 +48,7 @@ class GenerousEnt(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def forestcycling_forest(self, env):
-        log.info(f"Forestcycling {self} for Forest")
+        log.info("Forestcycling %s for Forest", self)
         env.engine.pay_mana({"W": 0, "U": 0, "B": 0, "R": 0, "G": 0, "C": 1})
         env.engine.discard_card(self)
         env.engine.search_library_for("Forest")
@@ -58,7 +58,7 @@ class GenerousEnt(MTGCreatureSpell):
         return self in env.hand and any(c.name == "Forest" for c in env.library) and sum(env.mana_pool.values()) > 0
 
     def forestcycling_mire(self, env):
-        log.info(f"Forestcycling {self} for Haunted Mire")
+        log.info("Forestcycling %s for Haunted Mire", self)
         env.engine.pay_mana({"W": 0, "U": 0, "B": 0, "R": 0, "G": 0, "C": 1})
         env.engine.discard_card(self)
         env.engine.search_library_for("Haunted Mire")
@@ -87,7 +87,7 @@ class TrollOfKhazadDum(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def swampcycling_swamp(self, env):
-        log.info(f"Swampcycling {self} for Swamp")
+        log.info("Swampcycling %s for Swamp", self)
         env.engine.pay_mana({"W": 0, "U": 0, "B": 0, "R": 0, "G": 0, "C": 1})
         env.engine.discard_card(self)
         env.engine.search_library_for("Swamp")
@@ -97,7 +97,7 @@ class TrollOfKhazadDum(MTGCreatureSpell):
         return self in env.hand and any(c.name == "Swamp" for c in env.library) and sum(env.mana_pool.values()) > 0
 
     def swampcycling_mire(self, env):
-        log.info(f"Swampcycling {self} for Haunted Mire")
+        log.info("Swampcycling %s for Haunted Mire", self)
         env.engine.pay_mana({"W": 0, "U": 0, "B": 0, "R": 0, "G": 0, "C": 1})
         env.engine.discard_card(self)
         env.engine.search_library_for("Haunted Mire")
@@ -126,7 +126,7 @@ class SaguWildling(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def roost_seek_forest(self, env):
-        log.info(f"Casting Roost Seek {self} for Forest")
+        log.info("Casting Roost Seek %s for Forest", self)
         env.engine.pay_mana({"W": 0, "U": 0, "B": 0, "R": 0, "G": 1, "C": 0})
         env.engine.put_from_hand_to_library(self)
         env.engine.search_library_for("Forest")
@@ -136,7 +136,7 @@ class SaguWildling(MTGCreatureSpell):
         return self in env.hand and any(c.name == "Forest" for c in env.library) and env.mana_pool["G"] > 0 and not env.engine.passing
 
     def roost_seek_swamp(self, env):
-        log.info(f"Casting Roost Seek {self} for Swamp")
+        log.info("Casting Roost Seek %s for Swamp", self)
         env.engine.pay_mana({"W": 0, "U": 0, "B": 0, "R": 0, "G": 1, "C": 0})
         env.engine.put_from_hand_to_library(self)
         env.engine.search_library_for("Swamp")
@@ -161,7 +161,7 @@ class OrnithopterOfParadise(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def tap_for_mana_G(self, env):
-        log.info(f"Tapping for mana {self}")
+        log.info("Tapping for mana %s", self)
         env.engine.add_mana('G', 1)
         self.is_tapped = True
 
@@ -169,7 +169,7 @@ class OrnithopterOfParadise(MTGCreatureSpell):
         return self in env.battlefield and not self.has_summoning_sickness and not self.is_tapped
 
     def tap_for_mana_B(self, env):
-        log.info(f"Tapping for mana {self}")
+        log.info("Tapping for mana %s", self)
         env.engine.add_mana('B', 1)
         self.is_tapped = True
 
@@ -191,7 +191,7 @@ class OvergrownBattlement(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def tap_for_mana_G(self, env):
-        log.info(f"Tapping for mana {self}")
+        log.info("Tapping for mana %s", self)
         env.engine.add_mana('G', sum(c.is_defender for c in env.battlefield if isinstance(c, MTGCreatureSpell)))
         self.is_tapped = True
 
@@ -213,7 +213,7 @@ class ElvesOfDeepShadow(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def tap_for_mana_B(self, env):
-        log.info(f"Tapping for mana {self}")
+        log.info("Tapping for mana %s", self)
         env.engine.add_mana('B', 1)
         env.counter_life -= 1
         self.is_tapped = True
@@ -248,16 +248,21 @@ class SaruliCaretaker(MTGCreatureSpell):
         super().__init__("Saruli Caretaker", "G", False, True)
 
     def actions(self, env):
-        actions = super().actions(env)
+        yield from super().actions(env)
+        # tapping needs an untapped Saruli without summoning sickness: skip the
+        # enumeration altogether otherwise
+        if self not in env.battlefield or self.has_summoning_sickness or self.is_tapped:
+            return
+        can_tap_for_b = self._can_tap_for_b(env)
         # we need to compute dynamically which creatures Saruli can tap to make mana
         # and for each of them give the option to produce B or G
         for i, creature in enumerate(env.battlefield):
             if not isinstance(creature, MTGCreatureSpell):
                 continue
             if creature != self and not creature.is_tapped:
-                actions.append(f"tap_creature_for_mana_G@{i}")
-                actions.append(f"tap_creature_for_mana_B@{i}")
-        return actions
+                yield f"tap_creature_for_mana_G@{i}"
+                if can_tap_for_b:
+                    yield f"tap_creature_for_mana_B@{i}"
 
     def cast(self, env):
         super().cast(env)
@@ -267,7 +272,7 @@ class SaruliCaretaker(MTGCreatureSpell):
 
     def tap_creature_for_mana_G(self, env, i):
         i = int(i)
-        log.info(f"Tapping {self} and {env.battlefield[i]} for mana G")
+        log.info("Tapping %s and %s for mana G", self, env.battlefield[i])
         env.engine.add_mana('G', 1)
         env.battlefield[i].is_tapped = True
         self.is_tapped = True
@@ -278,16 +283,19 @@ class SaruliCaretaker(MTGCreatureSpell):
 
     def tap_creature_for_mana_B(self, env, i):
         i = int(i)
-        log.info(f"Tapping {self} and {env.battlefield[i]} for mana B")
+        log.info("Tapping %s and %s for mana B", self, env.battlefield[i])
         env.engine.add_mana('B', 1)
         env.battlefield[i].is_tapped = True
         self.is_tapped = True
 
     def tap_creature_for_mana_B_available(self, env, i):
+        return self.tap_creature_for_mana_G_available(env, i) and self._can_tap_for_b(env)
+
+    @staticmethod
+    def _can_tap_for_b(env):
         # optimization: never tap for B if no B creature card in hand
-        # optimization = False
-        optimization = any(s for s in env.hand if hasattr(s, "can_be_cast_for_black") and s.can_be_cast_for_black)
-        return self.tap_creature_for_mana_G_available(env, i) and optimization
+        # return True
+        return any(s for s in env.hand if hasattr(s, "can_be_cast_for_black") and s.can_be_cast_for_black)
 
 
 class QuirionRanger(MTGCreatureSpell):
@@ -295,16 +303,17 @@ class QuirionRanger(MTGCreatureSpell):
         super().__init__("Quirion Ranger", "G", False, False)
 
     def actions(self, env):
-        actions = super().actions(env)
+        yield from super().actions(env)
+        if self not in env.battlefield or self.ability_once_per_turn_activated:
+            return
+        forests = [j for j, land in enumerate(env.lands) if isinstance(land, Forest)]
         # we need to compute dynamically which creatures Quirion can untap
         # and for each of them give the option to bounce a land
         for i, creature in enumerate(env.battlefield):
             if not isinstance(creature, MTGCreatureSpell):
                 continue
-            for j, land in enumerate(env.lands):
-                if isinstance(land, Forest):
-                    actions.append(f"untap_creature_bouncing_land@{i},{j}")
-        return actions
+            for j in forests:
+                yield f"untap_creature_bouncing_land@{i},{j}"
 
     def cast(self, env):
         super().cast(env)
@@ -315,7 +324,7 @@ class QuirionRanger(MTGCreatureSpell):
     def untap_creature_bouncing_land(self, env, ij):
         i, j = ij.split(",")
         i, j = int(i), int(j)
-        log.info(f"Untapping {env.battlefield[i]} and bouncing {env.lands[j]}")
+        log.info("Untapping %s and bouncing %s", env.battlefield[i], env.lands[j])
         env.battlefield[i].is_tapped = False
         env.engine.bounce_land_to_hand(env.lands[j])
         self.ability_once_per_turn_activated = True
@@ -372,7 +381,7 @@ class BalustradeSpy(MTGCreatureSpell):
             if len(env.library) == 0:
                 break
             card = env.library.pop(0)
-            log.info(f"Revealed {card}")
+            log.info("Revealed %s", card)
             env.graveyard.append(card)
             if isinstance(card, MTGLand):
                 break
@@ -390,13 +399,13 @@ class WallOfRoots(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def put_counter_for_mana_G(self, env):
-        log.info(f"Putting a -0/-1 counter on {self} to add G")
+        log.info("Putting a -0/-1 counter on %s to add G", self)
         self.ability_once_per_turn_activated = True
         env.engine.add_mana('G', 1)
 
         self.minus_counters += 1
         if self.minus_counters == 5:
-            log.info(f"Wall of Roots has 0 toughness and dies")
+            log.info("Wall of Roots has 0 toughness and dies")
             self.minus_counters = 0
             env.engine.sacrifice_creature(self)
 
@@ -450,7 +459,7 @@ class DimirHouseGuard(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def transmute_for_Spy(self, env):
-        log.info(f"Transmuting {self} for Balustrade Spy")
+        log.info("Transmuting %s for Balustrade Spy", self)
         env.engine.pay_mana(self.transmute_cost_map)
         env.engine.discard_card(self)
         env.engine.search_library_for("Balustrade Spy")
@@ -472,7 +481,7 @@ class EldraziSpawn(MTGCreatureSpell):
         super().enters_the_battlefield(env)
 
     def sacrifice_for_mana_C(self, env):
-        log.info(f"Sacrificing {self} for C")
+        log.info("Sacrificing %s for C", self)
         env.engine.sacrifice_creature(self)
         env.engine.add_mana('C', 1)
 
@@ -49,7 +49,7 @@ class MTGLand(MTGCard):
 
     @abstractmethod
     def play(self, env):
-        log.info(f"Playing {self}")
+        log.info("Playing %s", self)
         env.played_land_this_turn = True
         env.engine.play_land(self)
 
@@ -57,7 +57,7 @@ class MTGLand(MTGCard):
         return self in env.hand and not env.played_land_this_turn and not env.engine.passing
 
     def tap_for_mana(self, env):
-        log.info(f"Tapping for mana {self}")
+        log.info("Tapping for mana %s", self)
         self.is_tapped = True
 
     def tap_for_mana_available(self, env):
@@ -74,7 +74,7 @@ class MTGSpell(MTGCard):
 
     @abstractmethod
     def cast(self, env):
-        log.info(f"Casting {self}")
+        log.info("Casting %s", self)
         env.engine.pay_mana(self.mana_cost_map)
 
     def cast_available(self, env):
@@ -83,11 +83,15 @@ class MTGSpell(MTGCard):
         return self.mana_available(env, self.mana_cost_map)
 
     def mana_available(self, env, mana_cost_map):
-        all_mana_available = sum(env.mana_pool.values())
+        return self.mana_available_in_pool(env.mana_pool, mana_cost_map)
+
+    @staticmethod
+    def mana_available_in_pool(mana_pool, mana_cost_map):
+        all_mana_available = sum(mana_pool.values())
 
         # check if enough color-specific mana is available
         for specific_mana in MANA_TYPES[:-1]:
-            if env.mana_pool[specific_mana] < mana_cost_map[specific_mana]:
+            if mana_pool[specific_mana] < mana_cost_map[specific_mana]:
                 return False
             all_mana_available -= mana_cost_map[specific_mana]
 
@@ -121,5 +125,5 @@ class MTGCreatureSpell(MTGSpell):
 
     @abstractmethod
     def enters_the_battlefield(self, env):
-        log.info(f"Enters the battlefield {self}")
+        log.info("Enters the battlefield %s", self)
         self.has_summoning_sickness = True
@@ -61,7 +61,7 @@ class WindingWay(MTGSpell):
         for _ in range(4):
             try:
                 card = env.library.pop(0)
-                log.info(f"Revealed {card}")
+                log.info("Revealed %s", card)
                 if isinstance(card, MTGCreatureSpell):
                     env.hand.append(card)
                 else:
@@ -84,7 +84,7 @@ class LeadTheStampede(MTGSpell):
         for _ in range(5):
             try:
                 card = env.library.pop(0)
-                log.info(f"Looking at {card}")
+                log.info("Looking at %s", card)
                 cards.append(card)
             except IndexError:
                 continue
@@ -93,7 +93,7 @@ class LeadTheStampede(MTGSpell):
         # never reveal Lotleth Giant
         for card in cards:
             if isinstance(card, MTGCreatureSpell) and not card.name == "Lotleth Giant":
-                log.info(f"Revealed {card}")
+                log.info("Revealed %s", card)
                 env.hand.append(card)
             else:
                 on_the_bottom.append(card)
@@ -102,13 +102,13 @@ class LeadTheStampede(MTGSpell):
         # always put lands at the bottom, to enable an earlier Spy
         for card in on_the_bottom:
             if not isinstance(card, MTGLand):
-                log.info(f"Put bottom {card}")
+                log.info("Put bottom %s", card)
                 env.library.append(card)
             else:
                 lands_on_the_bottom.append(card)
 
         for card in lands_on_the_bottom:
-            log.info(f"Put bottom {card} (we are pro!)")
+            log.info("Put bottom %s (we are pro!)", card)
             env.library.append(card)
             env.known_lands_bottom += 1
 
@@ -123,21 +123,29 @@ class DreadReturn(MTGSpell):
         MTGSpell.__init__(self, "Dread Return", "2BB", True)
 
     def actions(self, env):
+        # Actions are generated lazily and only for legal candidates: on wide boards
+        # the number of (target, triple) combinations explodes quickly
+        if env.engine.passing or not self._combo_in_graveyard(env):
+            return
+        targets = [i for i, c in enumerate(env.graveyard) if isinstance(c, MTGCreatureSpell)]
+
         # we need to compute dynamically which creatures Dread Return can reanimate
         # while cast from hand
-        actions = []
-        for i, creature in enumerate(env.graveyard):
-            actions.append(f"cast_with_target@{i}")
+        if self in env.hand:
+            for i in targets:
+                yield f"cast_with_target@{i}"
 
         # we need to compute dynamically which creatures Dread Return can reanimate
         # and which creatures have to be sacrificed while cast with flashback
-        for i, creature in enumerate(env.graveyard):
-            for triple in itertools.combinations(range(len(env.battlefield)), 3):
-                all_creatures = all(isinstance(env.battlefield[c], MTGCreatureSpell) for c in triple)
-                if not all_creatures:
-                    continue
-                actions.append(f"flashback_with_target@{i},{'-'.join(str(c) for c in triple)}")
-        return actions
+        if self in env.graveyard:
+            creatures = [i for i, c in enumerate(env.battlefield) if isinstance(c, MTGCreatureSpell)]
+            for i in targets:
+                for triple in itertools.combinations(creatures, 3):
+                    yield f"flashback_with_target@{i},{'-'.join(str(c) for c in triple)}"
+
+    @staticmethod
+    def _combo_in_graveyard(env):
+        return any(isinstance(c, BalustradeSpy) for c in env.graveyard) and any(isinstance(c, LotlethGiant) for c in env.graveyard)
 
     def cast(self, env):
         raise ValueError("Dread Return: cast - Not implemented")
@@ -145,22 +153,22 @@ class DreadReturn(MTGSpell):
     def cast_with_target(self, env, i):
         super().cast(env)
         target = env.graveyard[int(i)]
-        log.info(f"Targeting {target}")
+        log.info("Targeting %s", target)
         env.engine.put_from_graveyard_to_battlefield(target)
         env.engine.put_from_hand_to_graveyard(self)
 
     def cast_with_target_available(self, env, i):
         # optional: enable only if Giant/Spy in graveyard
         # optimization = False
-        optimization = any(isinstance(c, BalustradeSpy) for c in env.graveyard) and any(isinstance(c, LotlethGiant) for c in env.graveyard)
+        optimization = self._combo_in_graveyard(env)
         return super().cast_available(env) and isinstance(env.graveyard[int(i)], MTGCreatureSpell) and not env.engine.passing and optimization
 
     def flashback_with_target(self, env, itriple):
-        log.info(f"Flashing back {self}")
+        log.info("Flashing back %s", self)
         i, triple = itriple.split(",")
         target = env.graveyard[int(i)]
         creatures_to_sac = [env.battlefield[int(i)] for i in triple.split("-")]
-        log.info(f"Targeting {target} saccing {creatures_to_sac}")
+        log.info("Targeting %s saccing %s", target, creatures_to_sac)
         env.engine.put_from_graveyard_to_exile(self)
         for creature_to_sac in creatures_to_sac:
             env.engine.sacrifice_creature(creature_to_sac)
@@ -169,7 +177,7 @@ class DreadReturn(MTGSpell):
     def flashback_with_target_available(self, env, itriple):
         # optional: enable only if Giant/Spy in graveyard
         # optimization = False
-        optimization = any(isinstance(c, BalustradeSpy) for c in env.graveyard) and any(isinstance(c, LotlethGiant) for c in env.graveyard)
+        optimization = self._combo_in_graveyard(env)
         i, triple = itriple.split(",")
         creatures_to_sac = [env.battlefield[int(i)] for i in triple.split("-")]
         all_creatures_to_sac = all(isinstance(c, MTGCreatureSpell) for c in creatures_to_sac)
@@ -191,7 +199,7 @@ class LotusPetal(MTGArtifactSpell):
         return super().cast_available(env)
 
     def sacrifice_for_mana_G(self, env):
-        log.info(f"Sacrificing {self} for G")
+        log.info("Sacrificing %s for G", self)
         env.engine.add_mana('G', 1)
         env.engine.sacrifice_permanent(self)
 
@@ -200,7 +208,7 @@ class LotusPetal(MTGArtifactSpell):
         return self in env.battlefield and not env.engine.passing
 
     def sacrifice_for_mana_B(self, env):
-        log.info(f"Sacrificing {self} for B")
+        log.info("Sacrificing %s for B", self)
         env.engine.add_mana('B', 1)
         env.engine.sacrifice_permanent(self)
 
@@ -213,14 +221,31 @@ class ElvenFarsight(MTGSpell):
         MTGSpell.__init__(self, "Elven Farsight", "G", False)
 
     def actions(self, env):
-        actions = []
+        # all the orderings share the same availability: check it only once
+        if not self.cast_scry_top_available(env, None):
+            return
         # In theory, Elven Farsight can lead to 24 different combinations.
         # In practice, we'll put cards on the bottom in a pseudo-random order.
         # This will reduce the possible combinations to 16.
+        # Orderings that leave the library with the same card names are skipped.
+        cards = env.library[0:3]
+        outcomes = set()
         for cards_on_top in range(0, 4):  # you can keep on top 0, 1, 2, or 3 cards
             for order_on_top in itertools.permutations("012", cards_on_top):
-                actions.append("cast_scry_top@" + ','.join(order_on_top))
-        return actions
+                outcome = self._get_scry_outcome(cards, [int(i) for i in order_on_top])
+                if outcome not in outcomes:
+                    outcomes.add(outcome)
+                    yield "cast_scry_top@" + ','.join(order_on_top)
+
+    @staticmethod
+    def _get_scry_outcome(cards, cards_on_top):
+        # card names on top and on the bottom, in the order cast_scry_top puts them
+        cards_on_the_bottom = [cards[i] for i in range(3) if i not in cards_on_top]
+        return (
+            tuple(cards[i].name for i in cards_on_top),
+            tuple(c.name for c in cards_on_the_bottom if not isinstance(c, MTGLand)),
+            tuple(c.name for c in cards_on_the_bottom if isinstance(c, MTGLand)),
+        )
 
     def cast(self, env):
         raise ValueError("Elven Farsight: cast - Not implemented")
@@ -228,39 +253,39 @@ class ElvenFarsight(MTGSpell):
     def cast_scry_top(self, env, nuple):
         super().cast(env)
         cards_on_top = [int(i) for i in nuple.split(",") if i != '']
-        log.info(f"Keeping on top: {cards_on_top}")
+        log.info("Keeping on top: %s", cards_on_top)
         cards = []
         for _ in range(3):
             try:
                 card = env.library.pop(0)
-                log.info(f"Looking at {card}")
+                log.info("Looking at %s", card)
                 cards.append(card)
             except IndexError:
                 continue
 
         # put back cards on top, in the action order
         for i in reversed(cards_on_top):
-            log.info(f"Putting on top {cards[i]}")
+            log.info("Putting on top %s", cards[i])
             env.library.insert(0, cards[i])
 
         # The other cards can be put on the bottom in random order.
         # Let's optimize for the case where we have a land and Dread Return:
         # in this scenario we want the land as the last card of the deck.
         cards_on_the_bottom = [i for i in range(3) if i not in cards_on_top]
-        log.info(f"Putting on the bottom: {cards_on_the_bottom}")
+        log.info("Putting on the bottom: %s", cards_on_the_bottom)
         # first put non-lands on the bottom
         for card in [cards[i] for i in cards_on_the_bottom if not isinstance(cards[i], MTGLand)]:
-            log.info(f"Putting on the bottom {card}")
+            log.info("Putting on the bottom %s", card)
             env.library.append(card)
         # then put non-lands on the bottom
         for card in [cards[i] for i in cards_on_the_bottom if isinstance(cards[i], MTGLand)]:
-            log.info(f"Putting on the bottom {card}")
+            log.info("Putting on the bottom %s", card)
             env.library.append(card)
             env.known_lands_bottom += 1
 
         # reveal top: if creature, draw
         if isinstance(env.library[0], MTGCreatureSpell):
-            log.info(f"Revealing {env.library[0]} on top and drawing it")
+            log.info("Revealing %s on top and drawing it", env.library[0])
             env.engine.draw_cards(1)
 
         env.engine.put_from_hand_to_graveyard(self)
@@ -276,12 +301,14 @@ class MalevolentRumble(MTGSpell):
 
     def actions(self, env):
         actions = ["rumble_pick_nothing"]
+        picked = set()  # picking another copy of a card leads to the same game
         for i in range(0, 4):
-            if len(env.library) >= i + 1 and (
+            if len(env.library) >= i + 1 and env.library[i].name not in picked and (
                 isinstance(env.library[i], MTGLand) or
                 isinstance(env.library[i], MTGCreatureSpell) or
                 isinstance(env.library[i], MTGArtifactSpell)
             ):
+                picked.add(env.library[i].name)
                 actions.append(f"rumble_pick@{i}")
         return actions
 
@@ -293,7 +320,7 @@ class MalevolentRumble(MTGSpell):
         for _ in range(4):
             try:
                 card = env.library.pop(0)
-                log.info(f"Revealed {card}")
+                log.info("Revealed %s", card)
                 env.graveyard.append(card)
             except IndexError:
                 continue
@@ -308,9 +335,9 @@ class MalevolentRumble(MTGSpell):
         for i in range(4):
             try:
                 card = env.library.pop(0)
-                log.info(f"Revealed {card}")
+                log.info("Revealed %s", card)
                 if i == int(choice):
-                    log.info(f"Putting {card} in hand")
+                    log.info("Putting %s in hand", card)
                     env.hand.append(card)
                 else:
                     env.graveyard.append(card)
@@ -8,17 +8,45 @@ MANA_TYPES = ["W", "U", "B", "R", "G", "C"]
 INITIAL_HAND_SIZE = 7
 MAX_TURN = 7
 RESULTS_PATH = "../resources/results/"
+WORK_QUEUE_PATH = "../resources/results/work_queue.sqlite"
+RESULTS_DB_PATH = "../resources/results/results.sqlite"
+BENCHMARKS_PATH = "../resources/benchmarks/"
 CARD_IMAGES_PATH = "../resources/images"
+GUI_FRAME_INTERVAL_MS = 50  # the GUI shows at most one frame per interval
+GUI_REPLAY_SPEED_MS = 500  # per step, replaying a simulated game
 STOCK_DECK_PATH = "../resources/stock_main_no_initiative.txt"
 BASE_DECK_PATH = "../resources/base_deck.txt"
+RUMBLE_DECK_PATH = "../resources/main_rumble.txt"
 
 MANA_STRATEGY_SCRBG = "CRBG"  # Specific, Colorless, Red, Black, Green
 MANA_STRATEGY_SCRGB = "CRGB"  # Specific, Colorless, Red, Green, Black
 MAX_SOLVER_RUNTIME = 15 * 60  # minutes
+# at ~1100 nodes/s and ~5 MB per 1000 nodes, a solve hits the node budget after ~8
+# minutes (~2.5 GB): the memory budget is for states heavier than that
+MAX_SOLVER_NODES = 500000  # game states generated per solve
+MAX_SOLVER_MEMORY_MB = 3072  # resident memory of the solving process
+MEMORY_CHECK_EVERY_N_NODES = 1000
+WATCHDOG_POLL_SECONDS = 5
+WATCHDOG_GRACE_SECONDS = 10  # on top of the solver runtime, before a game process is killed
+MAX_WORKER_MEMORY_MB = 4096  # the watchdog kills game processes above it
+MCTS_MAX_RUNTIME = 30  # seconds, per MCTSSolver.solve
+MCTS_MAX_NODES = 5000  # tree nodes: each one keeps its env
+MCTS_MAX_ROLLOUT_STEPS = 500
+MCTS_EXPLORATION = 1.41  # UCB exploration constant, about sqrt(2)
+MCTS_CONFIDENCE_WORLDS = 4  # other shuffle seeds a kept hand is searched with, to measure a win
+MCTS_CONFIDENCE_BUDGET_SHARE = 0.25  # of the MCTS budget, for those searches
 MAX_INTERACTION_CARDS_IN_DECK = 8  # e.g. 4 Masked Vandal and 4 Mesmeric Fiend
 
 SOLITAIRE_SPY_CARDS_MODULE = "solitaire_spy.cards"
 CHECKPOINT_SIMULATIONS_EVERY_N = 10
+PROFILE_TOP_N = 40  # functions listed in the profiling report
+WORK_QUEUE_SEEDS_PER_TASK = 10
+WORK_QUEUE_LEASE_SECONDS = 5 * 60  # renewed by a heartbeat while the games of a task run
+WORK_QUEUE_HEARTBEAT_SECONDS = 60
+WORK_QUEUE_MAX_ATTEMPTS = 3  # leases of a task before it is given up
+SOLUTION_CACHE_MAX_SIZE = 200000  # solved game states kept per deck
+LIBRARY_KEY_CARDS_PER_TURN = 2  # library cards, in order, in a solution cache key per turn left
+TRACE_BUFFER_SIZE = 10000  # most recent steps kept by the tracer, when enabled
 MIN_TURN_WIN_POSSIBLE = 3
 EXECUTORS_NUM = multiprocessing.cpu_count()
 
@@ -26,3 +54,4 @@ EXECUTION_SUCCEEDED = 0
 EXECUTION_FAILED = -1
 EXECUTION_TIMEOUT = -2
 EXECUTION_TRUNCATED = -3
+EXECUTION_BUDGET_EXCEEDED = -4
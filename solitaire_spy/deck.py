@@ -5,7 +5,7 @@ import inspect
 import logging
 
 from collections import Counter
-from copy import deepcopy
+from functools import lru_cache
 
 from solitaire_spy.cards.creatures import *
 from solitaire_spy.cards.lands import *
@@ -18,7 +18,17 @@ from solitaire_spy.log import get_logger
 log = get_logger(__name__, stdout_level=logging.WARNING)
 
 
+_card_registry = None  # normalized card name -> card class, built once
+
+
+def normalize_card_name(name):
+    return name.strip().lower()
+
+
 def get_supported_cards_classes():
+    global _card_registry
+    if _card_registry is not None:
+        return _card_registry
     instances = {}
     for m in ["creatures", "lands", "spells"]:
         module_name = f"{SOLITAIRE_SPY_CARDS_MODULE}.{m}"
@@ -28,33 +38,64 @@ def get_supported_cards_classes():
             if obj.__module__ == module_name:
                 try:
                     new_obj = obj()  # instantiate without args
-                    instances[new_obj.name.lower()] = obj
+                    instances[normalize_card_name(new_obj.name)] = obj
                 except Exception as e:
                     log.warning(f"Skipping {name}: {e}")
-    return instances
+    _card_registry = instances
+    return _card_registry
 
-def load_deck(deck_file=STOCK_DECK_PATH):
-    log.info(f"Loading deck from {deck_file}...")
+
+def get_card_class(card_name):
     instances = get_supported_cards_classes()
-    deck = []
+    if normalize_card_name(card_name) not in instances:
+        raise Exception(f"Unsupported card: {card_name}")
+    return instances[normalize_card_name(card_name)]
+
+
+@lru_cache(maxsize=None)
+def _load_deck_spec(deck_file):
+    log.info(f"Loading deck from {deck_file}...")
+    deck_spec = Counter()
     with open(deck_file, "r") as f:
         for line in f.readlines():
             qty, card = line.rstrip("\n").split(" ", maxsplit=1)
-            if card.lower() not in instances:
-                raise Exception(f"Unsupported card: {card}")
-            else:
-                for _ in range(int(qty)):
-                    deck.append(instances[card.lower()]())
+            card_class = get_card_class(card)
+            deck_spec[card_class().name] += int(qty)
+    return deck_spec
+
+
+def load_deck_spec(deck_file=STOCK_DECK_PATH):
+    # a deck spec is a compact Counter {card name: quantity}: cards are only
+    # instantiated by build_deck, when a game actually starts
+    return Counter(_load_deck_spec(deck_file))
+
+
+def get_deck_spec(deck):
+    if isinstance(deck, Counter):
+        return deck
+    return Counter(c.name for c in deck)
+
+
+def build_deck(deck_spec):
+    deck = []
+    for card_name, qty in deck_spec.items():
+        card_class = get_card_class(card_name)
+        for _ in range(qty):
+            deck.append(card_class())
     return deck
 
 
+def load_deck(deck_file=STOCK_DECK_PATH):
+    return build_deck(load_deck_spec(deck_file))
+
+
 def get_deck_diff(deck, base_deck=BASE_DECK_PATH):
-    if not isinstance(base_deck, list):
-        base_deck = load_deck(base_deck)
+    if isinstance(base_deck, str):
+        base_deck = _load_deck_spec(base_deck)
 
-    deck_counter = dict(Counter(c.name for c in deck))
+    deck_counter = get_deck_spec(deck)
     deck_text = "\n".join(sorted(f"{k}: {v}" for k, v in deck_counter.items()))
-    base_deck_counter = dict(Counter(c.name for c in base_deck))
+    base_deck_counter = get_deck_spec(base_deck)
     base_deck_text = "\n".join(sorted(f"{k}: {v}" for k, v in base_deck_counter.items()))
     diff = difflib.unified_diff(
         base_deck_text.splitlines(),
@@ -66,13 +107,13 @@ def get_deck_diff(deck, base_deck=BASE_DECK_PATH):
 
 
 def get_deck_hash(deck):
-    s = ",".join(sorted(c.name for c in deck))
+    s = ",".join(sorted(get_deck_spec(deck).elements()))
     return hashlib.sha1(s.encode()).hexdigest()
 
 
 def deck_generator():
     decks = []
-    base_deck = load_deck(BASE_DECK_PATH)
+    base_deck = load_deck_spec(BASE_DECK_PATH)
     # sort for loops wisely: outer gets less priority
     for forest_number in range(0, 1):
         for ornithopter_number in range(0, 1):
@@ -91,25 +132,28 @@ def deck_generator():
                                                     tinder_wall_number + petal_number +
                                                     guard_number + rumble_number
                                                 )
-                                            flex_slots = 60 - len(base_deck)
+                                            flex_slots = 60 - sum(base_deck.values())
                                             if flex_slots - total_number > 4:  # too few cards
                                                 # we want to MesmericFiend-fill up to 4 slots
                                                 continue
                                             if total_number > flex_slots:  # too many cards
                                                 continue
-                                            new_deck = deepcopy(base_deck)
-                                            new_deck += forest_number * [Forest()]
-                                            new_deck += ornithopter_number * [OrnithopterOfParadise()]
-                                            new_deck += farsight_number * [ElvenFarsight()]
-                                            new_deck += gatecreeper_number * [GatecreeperVine()]
-                                            new_deck += quirion_number * [QuirionRanger()]
-                                            new_deck += troll_number * [TrollOfKhazadDum()]
-                                            new_deck += tinder_wall_number * [TinderWall()]
-                                            new_deck += petal_number * [LotusPetal()]
-                                            new_deck += guard_number * [DimirHouseGuard()]
-                                            new_deck += rumble_number * [MalevolentRumble()]
-                                            while len(new_deck) < 60:
-                                                new_deck.append(MesmericFiend())
+                                            # adding Counters drops the cards with quantity 0
+                                            new_deck = base_deck + Counter({
+                                                "Forest": forest_number,
+                                                "Ornithopter of Paradise": ornithopter_number,
+                                                "Elven Farsight": farsight_number,
+                                                "Gatecreeper Vine": gatecreeper_number,
+                                                "Quirion Ranger": quirion_number,
+                                                "Troll of Khazad-dum": troll_number,
+                                                "Tinder Wall": tinder_wall_number,
+                                                "Lotus Petal": petal_number,
+                                                "Dimir House Guard": guard_number,
+                                                "Malevolent Rumble": rumble_number,
+                                            })
+                                            fiend_number = DECK_SIZE - sum(new_deck.values())
+                                            if fiend_number > 0:
+                                                new_deck["Mesmeric Fiend"] += fiend_number
                                             decks.append(new_deck)
     log.info(f"Generated {len(decks)} decks")
     return decks
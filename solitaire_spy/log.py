@@ -12,6 +12,17 @@ DEFAULT_LOG_FORMAT = (
 )
 DEFAULT_LOGGING_FILE = posix_path(Path.home().as_posix(), f"{APPLICATION_NAME}.log")
 
+class LazyFileHandler(logging.FileHandler):
+    # the log file (and its folder) is only created when the first record is
+    # emitted: importing modules, e.g. in simulation workers, touches no file
+    def __init__(self, filename, mode="a", encoding=None):
+        super().__init__(filename, mode=mode, encoding=encoding, delay=True)
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+
 def get_logger(
     name=APPLICATION_NAME,
     log_format=DEFAULT_LOG_FORMAT,
@@ -19,13 +30,12 @@ def get_logger(
     file_name=DEFAULT_LOGGING_FILE,
     file_level=logging.INFO,
 ):
-    Path(file_name).parent.mkdir(exist_ok=True)
-    Path(file_name).touch(exist_ok=True)
     logging.basicConfig(format=log_format)
     logger = logging.getLogger(name)
     logger.setLevel(stdout_level)
-    file_handler = logging.FileHandler(file_name)
-    file_handler.setLevel(file_level)
-    file_handler.setFormatter(logging.Formatter(log_format))
-    logger.addHandler(file_handler)
+    if not logger.handlers:  # do not stack handlers on repeated calls
+        file_handler = LazyFileHandler(file_name)
+        file_handler.setLevel(file_level)
+        file_handler.setFormatter(logging.Formatter(log_format))
+        logger.addHandler(file_handler)
     return logger
@@ -1,13 +1,16 @@
 import timeit
 import threading
 import os
+import pickle
 import random
 import time
-import tkinter as tk
+from collections import Counter
 
-from solitaire_spy.constants import SEED
-from solitaire_spy.deck import load_deck, deck_generator
+from solitaire_spy.constants import SEED, GUI_REPLAY_SPEED_MS
+from solitaire_spy.cards.mtg_cards import MTGLand
+from solitaire_spy.deck import load_deck, deck_generator, build_deck
 from solitaire_spy.solver.core import Solver
+from solitaire_spy.solver.keep import log_keep_probabilities
 from solitaire_spy.solver.simulator import Simulator
 from solitaire_spy.spy_solitaire import MTGSolitaire
 
@@ -37,6 +40,33 @@ def solitaire(env: MTGSolitaire):
     print("You won!")
 
 
+def replay(env: MTGSolitaire, summary):
+    # plays a simulated game again: env must be built with scripted_shuffles=summary.shuffle_log
+    if summary.kept_at < 7:  # same mulligan as the solver (see Solver.mull_to)
+        while len(env.hand) > 0:
+            env.engine.put_from_hand_to_library(env.hand[0])
+        env.engine.shuffle_library()
+        env.engine.draw_cards(7)
+        for bottom in summary.mulled_bottom:
+            card = next(c for c in env.hand if c.name == bottom.name)
+            env.mulled_bottom.append(card)
+            env.engine.put_from_hand_to_library(card)
+            if isinstance(card, MTGLand):
+                env.known_lands_bottom += 1
+        env.kept_at = summary.kept_at
+        env.render()
+    env.initial_hand = list(env.hand)
+    for card, action in summary.steps_log:
+        card_name = card.name if card else None
+        env.step(*next(
+            (c, a) for c, a in env.engine.get_possible_actions()
+            if a == action and (c.name if c else None) == card_name
+        ))
+        env.render()
+    if env.opponent_counter_life <= 0:
+        print("You won!")
+
+
 def main_with_simulator():
     deck = load_deck()
     for i in range(7, 2, -1):
@@ -50,7 +80,8 @@ def main_with_simulator():
         simulator.log_stats()
 
 
-def multi_deck_simulator():
+def multi_deck_simulator(work_queue=None):
+    # with a work_queue file, workers on other hosts can join: python -m solitaire_spy.solver.work_queue <file>
     for deck in deck_generator():
         for i in range(7, 2, -1):
             simulator = Simulator(
@@ -58,11 +89,29 @@ def multi_deck_simulator():
                 800,
                 with_lucky_wins=False,
                 initial_hand_size=i,
+                work_queue=work_queue,
             )
             simulator.simulate()
             simulator.log_stats()
 
 
+def keep_probabilities():
+    # exact keep rates, in milliseconds: screen mana bases before simulating them
+    for deck in deck_generator():
+        log_keep_probabilities(deck)
+
+
+def import_results():
+    # indexes the results pickles for SQL queries across decks (see solver.results_db)
+    from solitaire_spy.solver.results_db import ResultsDatabase
+
+    database = ResultsDatabase()
+    try:
+        database.import_results()
+    finally:
+        database.close()
+
+
 def main_with_solver():
     deck = load_deck()
     env = MTGSolitaire(deck, None)
@@ -83,6 +132,8 @@ def main_no_gui():
 
 
 def main_with_gui():
+    import tkinter as tk  # the simulator must also run on hosts without Tk
+
     root = tk.Tk()
     root.title("MTGO at home - Turn 0")
     deck = load_deck()
@@ -93,5 +144,24 @@ def main_with_gui():
     root.mainloop()
 
 
+def main_replay_with_gui(pkl_file, index=0, replay_speed=GUI_REPLAY_SPEED_MS):
+    # replays the index-th game of a Simulator results file, without solving it again
+    import tkinter as tk  # the simulator must also run on hosts without Tk
+
+    with open(pkl_file, "rb") as f:
+        summary = pickle.load(f).summaries[index]
+    shuffle_log = getattr(summary, 'shuffle_log', None)  # attribute added later
+    if not shuffle_log:
+        raise ValueError(f"Game {index} of {pkl_file} has no shuffle log: it cannot be replayed")
+    root = tk.Tk()
+    root.title("MTGO at home - Turn 0")
+    deck = build_deck(Counter(shuffle_log[0]))
+    env = MTGSolitaire(deck, root, scripted_shuffles=shuffle_log, replay_speed=replay_speed)
+    thread = threading.Thread(target=replay, args=[env, summary], daemon=True)
+    thread.start()
+    root.geometry("1500x2000")
+    root.mainloop()
+
+
 if __name__ == '__main__':
     multi_deck_simulator()
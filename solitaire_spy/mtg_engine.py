@@ -9,6 +9,12 @@ from solitaire_spy.log import get_logger
 
 log = get_logger(__name__, stdout_level=logging.WARNING)
 
+# cards put on the bottom first when mulliganing: Lotleth Giant always the first pick
+DEAD_CARD_PRIORITY = {
+    card_class().name: priority
+    for priority, card_class in enumerate([LotlethGiant, DreadReturn, MesmericFiend, MaskedVandal])
+}
+
 
 class MtgEngine:
     def __init__(self, env):
@@ -29,7 +35,11 @@ class MtgEngine:
             return getattr(card, action_method)(self.env)
 
     def get_possible_actions(self):
-        possible_actions = []
+        return list(self.iter_possible_actions())
+
+    def iter_possible_actions(self):
+        # Lazily yields the possible actions, in the same order as get_possible_actions:
+        # callers only interested in the first match can stop early
         possible_actions_cache = set()
 
         for zone, zone_name in [
@@ -44,32 +54,31 @@ class MtgEngine:
                         # let's not add twice the same action... but redundant copies
                         # of Tinder Wall and Wall of Roots need to be treated separately
                         if (isinstance(card, TinderWall) or isinstance(card, WallOfRoots)) and "cast" not in action:
-                            log.debug(f"Available action from {zone_name}: {card} -> {action}")
-                            possible_actions.append((card, action))
+                            log.debug("Available action from %s: %s -> %s", zone_name, card, action)
+                            yield card, action
                         else:
                             if f"{card}X{action}" in possible_actions_cache:
                                 continue  # skip duplicate action
                             else:
                                 possible_actions_cache.add(f"{card}X{action}")
-                                log.debug(f"Available action from {zone_name}: {card} -> {action}")
-                                possible_actions.append((card, action))
+                                log.debug("Available action from %s: %s -> %s", zone_name, card, action)
+                                yield card, action
 
         different_mana_types_in_pool = sum(
             1 for t in self.env.mana_pool
             if self.env.mana_pool[t] > 1
         ) > 1
         if self.system_switch_mana_strategy_allowed and different_mana_types_in_pool:
-            log.debug(f"Available system action: system_switch_mana_strategy")
-            possible_actions.append((None, "system_switch_mana_strategy"))
+            log.debug("Available system action: system_switch_mana_strategy")
+            yield None, "system_switch_mana_strategy"
 
         # probably best to keep these as last
         if not self.passing:
-            log.debug(f"Available system action: system_pass")
-            possible_actions.append((None, "system_pass"))
+            log.debug("Available system action: system_pass")
+            yield None, "system_pass"
         else:
-            log.debug(f"Available system action: system_start_new_turn")
-            possible_actions.append((None, "system_start_new_turn"))
-        return possible_actions
+            log.debug("Available system action: system_start_new_turn")
+            yield None, "system_start_new_turn"
 
     def discard_card(self, card):
         self.env.hand.remove(card)
@@ -79,7 +88,7 @@ class MtgEngine:
         for _ in range(num_cards):
             try:
                 card = self.env.library.pop(0)
-                log.info(f"Drew {card}")
+                log.info("Drew %s", card)
                 self.env.hand.append(card)
             except IndexError:
                 msg = "Lost by drawing from empty library"
@@ -87,12 +96,12 @@ class MtgEngine:
                 raise GameLostException(msg)
 
     def get_dead_card_in_hand(self):
-        dead_cards = [LotlethGiant, DreadReturn, MesmericFiend, MaskedVandal]
-        for dead in dead_cards:  # Lotleth Giant always the first pick
-            for card in self.env.hand:
-                if isinstance(card, dead):
-                    return card
-        return None
+        dead_card, dead_card_priority = None, len(DEAD_CARD_PRIORITY)
+        for card in self.env.hand:
+            priority = DEAD_CARD_PRIORITY.get(card.name, dead_card_priority)
+            if priority < dead_card_priority:
+                dead_card, dead_card_priority = card, priority
+        return dead_card
 
     def get_worst_card_in_hand(self):
         dead_card = self.get_dead_card_in_hand()
@@ -146,7 +155,7 @@ class MtgEngine:
             self.env.mana_strategy = MANA_STRATEGY_SCRGB
         else:
             self.env.mana_strategy = MANA_STRATEGY_SCRBG
-        log.info(f"Switching mana strategy to {self.env.mana_strategy}")
+        log.info("Switching mana strategy to %s", self.env.mana_strategy)
         # system_switch_mana_strategy will be re-enabled only after a mana-consuming
         # action (e.g. casting a spell or activating an ability)
         self.system_switch_mana_strategy_allowed = False
@@ -196,28 +205,37 @@ class MtgEngine:
         to_zone.append(card)
 
     def pay_mana(self, mana_cost_map):
+        mana_to_pay = self.spend_mana(
+            self.env.mana_pool, mana_cost_map, self.env.mana_strategy
+        )
+
+        self.system_switch_mana_strategy_allowed = True
+
+        if mana_to_pay > 0:
+            raise ValueError(f"You are cheating: you can't pay {mana_to_pay} mana!")
+
+    @staticmethod
+    def spend_mana(mana_pool, mana_cost_map, mana_strategy):
+        # works on any mana pool, so that payments can also be simulated on copies
         # pay color-specific mana
         for specific_mana in MANA_TYPES[:-1]:
-            self.env.mana_pool[specific_mana] -= mana_cost_map[specific_mana]
+            mana_pool[specific_mana] -= mana_cost_map[specific_mana]
 
         # pay generic mana
         mana_to_pay = mana_cost_map["C"]
-        for color in self.env.mana_strategy:
+        for color in mana_strategy:
             if mana_to_pay > 0:
-                mana_to_pay = self._spend_mana_to_pay(color, mana_to_pay)
-
-        self.system_switch_mana_strategy_allowed = True
-
-        if mana_to_pay > 0:
-            raise ValueError(f"You are cheating: you can't pay {mana_to_pay} mana!")
+                mana_to_pay = MtgEngine._spend_mana_to_pay(mana_pool, color, mana_to_pay)
+        return mana_to_pay
 
-    def _spend_mana_to_pay(self, color, generic_mana_to_pay):
-        if self.env.mana_pool[color] >= generic_mana_to_pay:
-            self.env.mana_pool[color] -= generic_mana_to_pay
+    @staticmethod
+    def _spend_mana_to_pay(mana_pool, color, generic_mana_to_pay):
+        if mana_pool[color] >= generic_mana_to_pay:
+            mana_pool[color] -= generic_mana_to_pay
             return 0
         else:
-            generic_mana_to_pay -= self.env.mana_pool[color]
-            self.env.mana_pool[color] = 0
+            generic_mana_to_pay -= mana_pool[color]
+            mana_pool[color] = 0
             return generic_mana_to_pay
 
     def search_library_for(self, card_name):
@@ -227,7 +245,22 @@ class MtgEngine:
                 break
 
     def shuffle_library(self):
-        random.shuffle(self.env.library)
+        if self.env.scripted_shuffles:
+            # replays: the library gets the order it had in the replayed game
+            names = self.env.scripted_shuffles.pop(0)
+            library = list(self.env.library)
+            self.env.library.clear()
+            for name in names:
+                card = next(c for c in library if c.name == name)
+                library.remove(card)
+                self.env.library.append(card)
+        elif self.env.shuffle_seed is not None:
+            # determinized: the n-th shuffle of the game always gives the same order to the same cards
+            self.env.library.sort(key=lambda c: c.name)
+            random.Random(f"{self.env.shuffle_seed}|{len(self.env.shuffle_log)}").shuffle(self.env.library)
+        else:
+            random.shuffle(self.env.library)
+        self.env.shuffle_log.append(tuple(c.name for c in self.env.library))
         self.env.known_lands_bottom = 0
 
 class GameLostException(Exception):
@@ -0,0 +1,164 @@
+import glob
+import hashlib
+import logging
+import os
+import pickle
+from collections import OrderedDict
+
+from solitaire_spy.cards.mtg_cards import MTGLand
+from solitaire_spy.constants import *
+from solitaire_spy.log import get_logger
+from solitaire_spy.mtg_engine import GameLostException
+
+log = get_logger(__name__, stdout_level=logging.WARNING)
+
+NO_WIN = -1  # no win reachable by MAX_TURN
+
+
+class SolutionCache:
+    # LRU cache of solved game states: state key -> (win turn or NO_WIN, steps, shuffles, no win before turn).
+    # The steps, as (card name, action) pairs, lead from the state to the win, with the
+    # library shuffles (as in shuffle_log) they drew. A search stopped before MAX_TURN
+    # only knows that no win comes before the turn it was exploring.
+    # New entries are buffered and appended to a per-process shard file by flush(),
+    # so that the game processes of a Simulator never write the same file.
+    def __init__(self, cache_file=None, max_size=SOLUTION_CACHE_MAX_SIZE):
+        self.cache_file = cache_file
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.new_entries = []
+        self.hits = 0
+        self.misses = 0
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, "rb") as f:
+                for key, value in pickle.load(f):
+                    self._put(key, value)
+
+    @staticmethod
+    def get_library_prefix(env):
+        # The library cards that can still be drawn or milled before MAX_TURN, in order:
+        # LIBRARY_KEY_CARDS_PER_TURN per turn left, then up to the first land, where a Spy
+        # cast would stop milling. Deeper cards only count as a multiset, so a cached
+        # no-win assumes they do not matter; cached wins are replayed anyway.
+        depth = max(MAX_TURN - env.counter_turn, 0) * LIBRARY_KEY_CARDS_PER_TURN
+        prefix = env.library[:depth]
+        for card in env.library[depth:]:
+            prefix.append(card)
+            if isinstance(card, MTGLand):
+                break
+        return prefix
+
+    @staticmethod
+    def get_key(env, settings):
+        prefix = SolutionCache.get_library_prefix(env)
+        h = hashlib.sha1(env.functional_hash.encode())
+        h.update("|L|".join(c.name for c in prefix).encode())
+        h.update("|R|".join(sorted(c.name for c in env.library[len(prefix):])).encode())
+        h.update(f"|S|{settings}|{MAX_TURN}".encode())
+        return h.digest()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def put(self, key, value):
+        self._put(key, value)
+        if self.cache_file:
+            self.new_entries.append((key, value))
+
+    def put_win(self, key, win_turn, steps, shuffles):
+        steps = tuple((card.name if card else None, action) for card, action in steps)
+        self.put(key, (win_turn, steps, tuple(shuffles), win_turn))
+
+    def put_no_win(self, key, before_turn=MAX_TURN):
+        old = self.entries.get(key)
+        if old is not None and (old[0] != NO_WIN or old[3] >= before_turn):
+            return  # already knows more
+        self.put(key, (NO_WIN, (), (), before_turn))
+
+    def get_shard_file(self, pid=None):
+        return f"{self.cache_file}.{pid or os.getpid()}.shard"
+
+    @staticmethod
+    def _read_shard(shard_file):
+        with open(shard_file, "rb") as f:
+            while True:
+                try:
+                    yield from pickle.load(f)
+                except EOFError:
+                    break
+
+    def load_shard(self, pid):
+        # adds the entries flushed by another process (e.g. a finished game)
+        shard_file = self.get_shard_file(pid)
+        if os.path.exists(shard_file):
+            for key, value in self._read_shard(shard_file):
+                self._put(key, value)
+
+    def flush(self):
+        if not self.new_entries:
+            return
+        with open(self.get_shard_file(), "ab") as f:
+            pickle.dump(self.new_entries, f)
+        self.new_entries = []
+
+    @staticmethod
+    def compact(cache_file, max_size=SOLUTION_CACHE_MAX_SIZE):
+        # merges the shards written by the workers into cache_file (latest entries win)
+        cache = SolutionCache(cache_file, max_size)
+        shard_files = sorted(glob.glob(f"{glob.escape(cache_file)}.*.shard"))
+        for shard_file in shard_files:
+            for key, value in SolutionCache._read_shard(shard_file):
+                cache._put(key, value)
+        with open(cache_file, "wb") as f:
+            pickle.dump(list(cache.entries.items()), f)
+        for shard_file in shard_files:
+            os.remove(shard_file)
+        log.info("Solution cache %s: %s states", cache_file, len(cache.entries))
+        return cache
+
+
+def replay(env, steps, shuffles):
+    # plays cached steps, by card name, on an env with the same key: returns True on a win.
+    # The shuffles resolve as they did in the cached line, so a replay never draws from the RNG.
+    env.scripted_shuffles = list(shuffles)
+    try:
+        for card_name, action in steps:
+            card_action = next(
+                ((c, a) for c, a in env.engine.get_possible_actions()
+                 if a == action and (c.name if c else None) == card_name),
+                None,
+            )
+            if card_action is None:
+                return False
+            env.step(*card_action)
+    except GameLostException:
+        return False
+    finally:
+        env.scripted_shuffles = []
+    return env.opponent_counter_life <= 0
+
+
+_worker_cache = None
+
+
+def init_worker_solution_cache(cache_file):
+    # called by Simulator before forking its game processes: they inherit this cache,
+    # which Simulator grows with the shards of the finished games (see load_shard)
+    global _worker_cache
+    _worker_cache = SolutionCache(cache_file)
+
+
+def get_worker_solution_cache():
+    return _worker_cache
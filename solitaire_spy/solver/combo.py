@@ -0,0 +1,84 @@
+import logging
+from functools import lru_cache
+
+from solitaire_spy.cards.creatures import BalustradeSpy, LotlethGiant
+from solitaire_spy.cards.mtg_cards import MTGCreatureSpell, MTGLand
+from solitaire_spy.cards.spells import DreadReturn
+from solitaire_spy.log import get_logger
+from solitaire_spy.mtg_engine import MtgEngine
+from solitaire_spy.solver.tablebase import get_combo_key, get_finisher, lookup
+
+log = get_logger(__name__, stdout_level=logging.WARNING)
+
+
+class SpyMillOutcome:
+    def __init__(self, env, spy):
+        # Everything below is computed on the pre-cast env, without touching it:
+        # Spy is paid, enters the battlefield and mills until the first land.
+        mana_pool = dict(env.mana_pool)
+        MtgEngine.spend_mana(mana_pool, spy.mana_cost_map, env.mana_strategy)
+        self.mana_pool_after_cast = mana_pool
+
+        self.mill_stops_at = next(
+            (i for i, c in enumerate(env.library) if isinstance(c, MTGLand)),
+            len(env.library) - 1,
+        )
+        milled = env.library[:self.mill_stops_at + 1]
+        graveyard = env.graveyard + milled
+        hand = [c for c in env.hand if c is not spy]
+
+        self.cards_milled = len(milled)
+        self.creatures_in_graveyard = sum(
+            isinstance(c, MTGCreatureSpell) for c in graveyard
+        )
+        key = get_combo_key(graveyard, hand, env.battlefield + [spy], mana_pool)
+        self.giant_damage, self.move = lookup(key, self.creatures_in_graveyard, env.opponent_counter_life)
+        self.is_lethal = self.move is not None
+
+    def get_finisher(self, env):
+        # to be called on the env after Spy has been cast: returns the Dread Return
+        # action that reanimates Lotleth Giant for lethal
+        return get_finisher(env, self.move)
+
+
+def evaluate_spy_mill(env, spy):
+    return SpyMillOutcome(env, spy)
+
+
+@lru_cache(maxsize=None)
+def _blind_spy_win_probability(damage_needed, creatures_on_board, lands, drs, giants, spies, creatures,
+                               drs_in_graveyard):
+    # blind_spy needs numpy: only loaded by solves with blind_spy_odds
+    from solitaire_spy.blind_spy import exact_damage_distribution
+
+    damage_histogram = exact_damage_distribution(
+        (lands, creatures_on_board, drs, giants, spies, creatures), drs_in_graveyard
+    )
+    return float(damage_histogram[damage_needed:].sum())
+
+
+def evaluate_blind_spy(env, spy):
+    # Chance of winning right away by casting Spy while some lands in the library are
+    # unknown, according to the blind_spy model (Dread Return flashback only: Dread
+    # Returns in hand are not counted, and neither are Giants and Spies already in
+    # the graveyard). Returns None if the cast is not blind.
+    from solitaire_spy.blind_spy import MAX_CREATURES_ON_BOARD
+
+    lands = sum(isinstance(c, MTGLand) for c in env.library) - env.known_lands_bottom
+    if lands <= 0:
+        return None
+    creatures_on_board = 1 + sum(isinstance(c, MTGCreatureSpell) for c in env.battlefield)
+    if creatures_on_board < 3:  # not enough creatures to flashback Dread Return
+        return 0.0
+    drs = sum(isinstance(c, DreadReturn) for c in env.library)
+    drs_in_graveyard = sum(isinstance(c, DreadReturn) for c in env.graveyard)
+    giants = sum(isinstance(c, LotlethGiant) for c in env.library)
+    spies = sum(isinstance(c, BalustradeSpy) for c in env.library)
+    creatures = sum(isinstance(c, MTGCreatureSpell) for c in env.library) - giants - spies
+    # creatures already in the graveyard are reanimated as well
+    creatures_in_graveyard = sum(isinstance(c, MTGCreatureSpell) for c in env.graveyard)
+    damage_needed = max(1, env.opponent_counter_life - creatures_in_graveyard)
+    return _blind_spy_win_probability(
+        damage_needed, min(creatures_on_board, MAX_CREATURES_ON_BOARD), lands, drs, giants, spies, creatures,
+        drs_in_graveyard,
+    )
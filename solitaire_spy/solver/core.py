@@ -1,4 +1,4 @@
-import random
+import os
 import timeit
 from collections import defaultdict
 from copy import deepcopy
@@ -6,45 +6,94 @@ import logging
 
 from solitaire_spy.constants import *
 from solitaire_spy.mtg_engine import GameLostException
+from solitaire_spy.solver.cache import NO_WIN, SolutionCache, replay
+from solitaire_spy.solver.combo import evaluate_spy_mill, evaluate_blind_spy
 from solitaire_spy.solver.heuristics import *
+from solitaire_spy.solver.keep import get_bottom_choices, get_category_counts, is_keep_hand
+from solitaire_spy.solver.tablebase import get_winning_action
 from solitaire_spy.spy_solitaire import MTGSolitaire
+from solitaire_spy.trace import tracer
 
 from solitaire_spy.log import get_logger
 
 log = get_logger(__name__, stdout_level=logging.WARNING)
 
 
+def get_memory_usage_mb(pid="self"):
+    # resident memory of a process, from /proc (0 where it is not available)
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return 0
+
+
+class PartialResult:
+    # where a solve stopped when it ran out of budget
+    def __init__(self, budget, deepest_turn, frontier_size, nodes, best_env):
+        self.budget = budget  # "runtime", "nodes" or "memory"
+        self.deepest_turn = deepest_turn
+        self.frontier_size = frontier_size  # envs still queued
+        self.nodes = nodes
+        self.best_env = best_env  # lowest opponent life, then smallest library
+
+    def __str__(self):
+        return (f"Budget exceeded: {self.budget}\n"
+                f"Deepest turn: {self.deepest_turn}\n"
+                f"Frontier size: {self.frontier_size}\n"
+                f"Nodes: {self.nodes}")
+
+
+def copy_env_with_card(env, card):
+    # after deepcopy, objects get new ids: the deepcopy memo maps card to its copy,
+    # so that the actions listed on env can be played on the copy as they are
+    memo = {}
+    new_env = deepcopy(env, memo)
+    return new_env, (memo[id(card)] if card is not None else None)
+
+
 class Solver:
-    def __init__(self, env: MTGSolitaire):
+    def __init__(self, env: MTGSolitaire, solution_cache: SolutionCache = None):
         self.env_queues = defaultdict(list)  # one queue for each turn counter
         # We are going to create a list of queues.
         # Each i-th queue will contain all the games to be explored currently at turn i.
         self.env_queues[0] = [env]  # initial env and mulligans go to turn 0
-        self.heuristics = [
-            play_unique_action,
-            play_only_a_land,
-            tap_basic_land_for_mana,
-            cast_land_grant_for_free,
-            cast_lotus_petal,
-            no_useless_mana_switch_strategy,
-            cast_saruli_before_tapping_battlement,
-            cast_spell_if_only_option,
-            tutor_land_if_only_option,
-            mill_deck_with_spy,
-            flashback_giant_for_lethal,
-        ]
         self.explored_hashes = set()
         self.explored_hashes.add(env.functional_hash)
         self.turns_explored = 0
+        # best chance of a lucky win found casting Spy blind (see blind_spy_odds)
+        self.blind_spy_odds = 0.0
+        self.blind_spy_turn = -1
+        # states solved by previous solves: see _use_solution_cache
+        self.solution_cache = solution_cache
+        self.expanded_keys = []
+        self.cached_win = None  # earliest won env found replaying the solution cache
+        # budgets: see _get_exceeded_budget
+        self.nodes = 0
+        self.next_memory_check_at = 0  # /proc is read once every MEMORY_CHECK_EVERY_N_NODES
+        self.best_partial_env = None
+        self.partial_result = None
 
     def _get_obvious_action(self, env, possible_actions):
-        for heuristic in self.heuristics:
-            card, action = heuristic(env, possible_actions)
-            if action is not None:
-                return card, action
-        return None, None
+        # possible_actions: a list or MtgEngine.iter_possible_actions (see get_obvious_action)
+        # a won combo position needs no search: the tablebase knows the winning move
+        card, action = get_winning_action(env)
+        if action is not None and env.engine.is_action_possible(card, action):
+            return card, action
+        return get_obvious_action(env, possible_actions)
 
-    def solve(self, greedily=True, early_abort=True, start_time=None, with_lucky_wins=True, initial_hand_size=None):
+    def solve(self, greedily=True, early_abort=True, start_time=None, with_lucky_wins=True, initial_hand_size=None,
+              blind_spy_odds=False):
+        # With blind_spy_odds, Spy casts with unknown lands in the library are not
+        # played out: their win probability is recorded in self.blind_spy_odds
+        # and the search goes on looking for a scientific win.
+        if blind_spy_odds:
+            with_lucky_wins = False
+        if tracer.enabled:
+            tracer.reset()  # one trace per solve: dump it with tracer.dump()
+        # blind Spy odds are collected while expanding: cached subtrees would skip them
+        use_cache = self.solution_cache is not None and not blind_spy_odds
+        cache_settings = f"{greedily}|{early_abort}|{with_lucky_wins}"
         if not initial_hand_size:
             self.keep_and_mull()
         else:
@@ -52,25 +101,30 @@ class Solver:
         while sum(len(values) for _, values in self.env_queues.items()) > 0:
             queue_size = sum(len(values) for _, values in self.env_queues.items())
             if queue_size % 100 == 0:
-                log.info(f"In queue: {queue_size}")
+                log.info("In queue: %s", queue_size)
             # let's start from universes with low counter_turn
             for i in range(len(self.env_queues)):
                 if len(self.env_queues[i]) > 0:
                     env = self.env_queues[i].pop(0)
                     break
-            if start_time and timeit.default_timer() - start_time > MAX_SOLVER_RUNTIME:
-                log.info(
-                    f"Reached maximum computation time for solving "
-                    f"({MAX_SOLVER_RUNTIME:.2f} s). Aborting..."
-                )
-                return EXECUTION_TIMEOUT, env
+            if self.cached_win and env.counter_turn >= self.cached_win.counter_turn:
+                # no earlier win left to find
+                return self._succeeded(self.cached_win, use_cache)
+            budget = self._get_exceeded_budget(start_time)
+            if budget:
+                return self._out_of_budget(budget, env)
+            if self.best_partial_env is None or (env.opponent_counter_life, len(env.library)) < (
+                    self.best_partial_env.opponent_counter_life, len(self.best_partial_env.library)):
+                self.best_partial_env = env
 
             if env.counter_turn > self.turns_explored:
-                log.info(f"Playing turn {env.counter_turn}")
+                log.info("Playing turn %s", env.counter_turn)
                 self.turns_explored = env.counter_turn
 
             if env.counter_turn >= MAX_TURN:
-                log.info(f"Playing turn {env.counter_turn}")
+                log.info("Playing turn %s", env.counter_turn)
+                if use_cache:
+                    self._mark_no_win()
                 return EXECUTION_TRUNCATED, env
 
             if early_abort and self.is_useless_game(env):
@@ -90,12 +144,11 @@ class Solver:
                     game_loss = True
                     break
 
-                possible_actions = env.engine.get_possible_actions()
-                card, action = self._get_obvious_action(env, possible_actions)
+                card, action = self._get_obvious_action(env, env.engine.iter_possible_actions())
                 if action is not None:
-                    log.debug(f"Queuing after obvious action {card}: {action}")
+                    log.debug("Queuing after obvious action %s: %s", card, action)
                     try:
-                        env.step(card, action)
+                        self._step(env, card, action)
                         # env.render()
                         if env.opponent_counter_life <= 0:
                             if not with_lucky_wins and env.unknown_lands_in_deck_on_combo > 0:
@@ -103,58 +156,167 @@ class Solver:
                                 game_loss = True
                                 continue
                             else:
-                                log.info(
-                                    f"You won at turn {env.counter_turn} "
-                                    f"(lands in deck: {sum(isinstance(c, MTGLand) for c in env.library)}, "
-                                    f"cards in library: {len(env.library)}, "
-                                    f"keep at {env.kept_at})!"
-                                )
-                                return EXECUTION_SUCCEEDED, env
+                                self._log_win(env)
+                                return self._succeeded(env, use_cache)
                     except GameLostException:
                         game_loss = True
                         break
             if game_loss:
                 continue  # pick the next env
 
+            if use_cache and self._use_solution_cache(env, cache_settings):
+                continue  # already solved
+
             possible_actions = env.engine.get_possible_actions()  # refresh after obvious ones
+            if blind_spy_odds:
+                self._evaluate_blind_spy(env)
             if greedily:
                 possible_actions = self.greedify_action(env, possible_actions)
 
             # no obvious action: BFS-search
-            for i in range(len(possible_actions)):
-                new_env = deepcopy(env)
-                # after deepcopy, objects get new ids: need to re-get_possible_actions
-                # (and we know there are no obvious ones)
-                new_possible_actions = new_env.engine.get_possible_actions()
-                if greedily:
-                    new_possible_actions = self.greedify_action(new_env, new_possible_actions)
-                card, action = new_possible_actions[i]
+            for card, action in possible_actions:
+                # a wide node must not overrun the budgets either
+                budget = self._get_exceeded_budget(start_time)
+                if budget:
+                    return self._out_of_budget(budget, env)
+                self.nodes += 1
+                new_env, card = copy_env_with_card(env, card)
                 try:
-                    log.debug(
-                        f"Queuing after possible action {card}: {action}"
-                    )
-                    new_env.step(card, action)
+                    log.debug("Queuing after possible action %s: %s", card, action)
+                    self._step(new_env, card, action)
                     if new_env.opponent_counter_life <= 0:
                         if not with_lucky_wins and env.unknown_lands_in_deck_on_combo > 0:
                             log.debug("Ignoring lucky win...")
                         else:
-                            log.info(
-                                f"You won at turn {new_env.counter_turn} "
-                                f"(lands in deck: {sum(isinstance(c, MTGLand) for c in new_env.library)}, "
-                                f"cards in library: {len(new_env.library)}, "
-                                f"keep at {new_env.kept_at})!"
-                            )
-                            return EXECUTION_SUCCEEDED, new_env
+                            self._log_win(new_env)
+                            return self._succeeded(new_env, use_cache)
                     new_env_hash = new_env.functional_hash
                     if new_env_hash not in self.explored_hashes:
                         self.env_queues[new_env.counter_turn].append(new_env)
                         self.explored_hashes.add(new_env_hash)
                     else:
-                        log.debug(f"Optimization (hash): branch already explored")
+                        log.debug("Optimization (hash): branch already explored")
                 except GameLostException:
                     continue  # pick the next action
+        if self.cached_win:
+            return self._succeeded(self.cached_win, use_cache)
+        if use_cache:
+            self._mark_no_win()
         return EXECUTION_FAILED, None
 
+    def _get_exceeded_budget(self, start_time):
+        if start_time and timeit.default_timer() - start_time > MAX_SOLVER_RUNTIME:
+            return "runtime"
+        if self.nodes >= MAX_SOLVER_NODES:
+            return "nodes"
+        if self.nodes >= self.next_memory_check_at:
+            self.next_memory_check_at = self.nodes + MEMORY_CHECK_EVERY_N_NODES
+            if get_memory_usage_mb() > MAX_SOLVER_MEMORY_MB:
+                return "memory"
+        return None
+
+    def _out_of_budget(self, budget, env):
+        # Returns EXECUTION_TIMEOUT with the current env on runtime, as always, and
+        # EXECUTION_BUDGET_EXCEEDED with the best partial env otherwise.
+        # Details go to self.partial_result; the frontier is released.
+        best_env = self.best_partial_env or env
+        self.partial_result = PartialResult(
+            budget,
+            max([self.turns_explored] + [turn for turn, values in self.env_queues.items() if values]),
+            sum(len(values) for values in self.env_queues.values()),
+            self.nodes,
+            best_env,
+        )
+        if self.expanded_keys:
+            self._mark_no_win(self.turns_explored)
+        self.env_queues.clear()
+        self.explored_hashes.clear()
+        if budget == "runtime":
+            log.info(
+                f"Reached maximum computation time for solving "
+                f"({MAX_SOLVER_RUNTIME:.2f} s). Aborting..."
+            )
+            return EXECUTION_TIMEOUT, env
+        log.info(f"Reached maximum {budget} for solving ({self.nodes} nodes). Aborting...")
+        return EXECUTION_BUDGET_EXCEEDED, best_env
+
+    def _use_solution_cache(self, env, cache_settings):
+        # Returns True if env needs no expansion: either it cannot win by MAX_TURN,
+        # or its cached win was replayed (and kept, if earlier than the others)
+        key = SolutionCache.get_key(env, cache_settings)
+        cached = self.solution_cache.get(key)
+        if cached is not None:
+            win_turn, steps, shuffles, no_win_before = cached
+            if win_turn == NO_WIN:
+                if no_win_before >= MAX_TURN or (
+                        self.cached_win and no_win_before >= self.cached_win.counter_turn):
+                    log.debug("Solution cache: no win from here before turn %s", no_win_before)
+                    return True
+                env.cache_keys.append((key, len(env.steps_log), len(env.shuffle_log)))
+                self.expanded_keys.append(key)
+                return False
+            won_env = deepcopy(env)
+            won_env.cache_keys.append((key, len(env.steps_log), len(env.shuffle_log)))
+            if replay(won_env, steps, shuffles):
+                log.debug("Solution cache: win at turn %s", won_env.counter_turn)
+                if self.cached_win is None or won_env.counter_turn < self.cached_win.counter_turn:
+                    self.cached_win = won_env
+                return True
+        env.cache_keys.append((key, len(env.steps_log), len(env.shuffle_log)))
+        self.expanded_keys.append(key)
+        return False
+
+    @staticmethod
+    def _log_win(env):
+        # the lands count walks the library: only when INFO is on
+        if log.isEnabledFor(logging.INFO):
+            log.info(
+                "You won at turn %s (lands in deck: %s, cards in library: %s, keep at %s)!",
+                env.counter_turn, sum(isinstance(c, MTGLand) for c in env.library), len(env.library), env.kept_at,
+            )
+
+    def _succeeded(self, env, use_cache):
+        if self.cached_win and self.cached_win.counter_turn < env.counter_turn:
+            env = self.cached_win
+        if use_cache:
+            self._mark_no_win(self.turns_explored)
+            # every solved state on the winning line can reach this win
+            for key, steps_played, shuffles_played in env.cache_keys:
+                self.solution_cache.put_win(
+                    key, env.counter_turn, env.steps_log[steps_played:], env.shuffle_log[shuffles_played:])
+        return EXECUTION_SUCCEEDED, env
+
+    def _mark_no_win(self, before_turn=MAX_TURN):
+        # the search is complete up to before_turn (the turns below the one being explored
+        # were searched in full, as the queues are popped by turn): no expanded state can win earlier
+        for key in self.expanded_keys:
+            self.solution_cache.put_no_win(key, before_turn)
+
+    def _step(self, env, card, action):
+        if isinstance(card, BalustradeSpy) and action == "cast":
+            # resolve the whole combo in one go: if the mill leads to a lethal
+            # Lotleth Giant, play it right away instead of expanding the post-mill tree
+            outcome = evaluate_spy_mill(env, card)
+            env.step(card, action)
+            if outcome.is_lethal:
+                finisher_card, finisher_action = outcome.get_finisher(env)
+                if env.engine.is_action_possible(finisher_card, finisher_action):
+                    log.debug("Spy mill is lethal: %s: %s", finisher_card, finisher_action)
+                    env.step(finisher_card, finisher_action)
+            return
+        env.step(card, action)
+
+    def _evaluate_blind_spy(self, env):
+        spy = next((c for c in env.hand if isinstance(c, BalustradeSpy)), None)
+        # only the mana matters here: BalustradeSpy.cast_available also asks for no unknown lands
+        if spy is None or not super(BalustradeSpy, spy).cast_available(env):
+            return
+        odds = evaluate_blind_spy(env, spy)
+        if odds is not None and odds > self.blind_spy_odds:
+            log.debug("Blind Spy at turn %s wins with probability %s", env.counter_turn, odds)
+            self.blind_spy_odds = odds
+            self.blind_spy_turn = env.counter_turn
+
     def is_useless_game(self, env):
         return env.counter_turn >= 2 and len(env.lands) == 0
 
@@ -226,13 +388,13 @@ class Solver:
             self.env_queues[0].pop(0)  # remove initial env: simulation won't start
 
     def mull_to(self, new_hand_size):
-        log.debug(f"Mull to: {new_hand_size}")
+        log.debug("Mull to: %s", new_hand_size)
         env = deepcopy(self.env_queues[0][0])  # clone the initial env
         env.kept_at = new_hand_size
         while len(env.hand) > 0:  # shuffle back initial hand
             env.engine.put_from_hand_to_library(env.hand[0])
         log.debug("Shuffling library...")
-        random.shuffle(env.library)
+        env.engine.shuffle_library()
 
         env.engine.draw_cards(7)
         cards_to_put_on_the_bottom = 7 - new_hand_size
@@ -252,7 +414,8 @@ class Solver:
             self.explored_hashes.add(env.functional_hash)
             return
         # create different envs, each one with a different card to mull
-        for nuple in itertools.combinations(range(len(env.hand)), cards_to_put_on_the_bottom):
+        hand_names = tuple(c.name for c in env.hand)
+        for nuple in get_bottom_choices(hand_names, cards_to_put_on_the_bottom):
             new_env = deepcopy(env)
             for i in reversed(nuple):  # from right to left, to not mess up with indices
                 if isinstance(new_env.hand[i], MTGLand):
@@ -264,7 +427,7 @@ class Solver:
                 self.env_queues[0].append(new_env)
                 self.explored_hashes.add(new_env_hash)
             else:
-                log.debug(f"Optimization (hash): branch already explored")
+                log.debug("Optimization (hash): branch already explored")
 
     def is_keep(self, hand_size):
         if hand_size == 3:
@@ -272,41 +435,8 @@ class Solver:
 
         hand = self.env_queues[0][0].hand
         library = self.env_queues[0][0].library
-
-        lands_num = sum(1 for c in hand if isinstance(c, MTGLand) or isinstance(c, LandGrant))
-        free_mana_num = sum(1 for c in hand if isinstance(c, LotusPetal))
-        mv1_tutor_num = sum(1 for c in hand if isinstance(c, SaguWildling) or isinstance(c, GenerousEnt) or isinstance(c, TrollOfKhazadDum))
-        mv1_dork_num = sum(1 for c in hand if isinstance(c, ElvesOfDeepShadow))
-        mv2_tutor_num = sum(1 for c in hand if isinstance(c, GatecreeperVine))
-        mv2_draw = sum(1 for c in hand if isinstance(c, WindingWay) or isinstance(c, MalevolentRumble))
-        dread_return_left = sum(1 for c in library if isinstance(c, DreadReturn))
-        giant_left = sum(1 for c in library if isinstance(c, LotlethGiant))
-        draw_creatures = sum(1 for c in hand if isinstance(c, WindingWay) or isinstance(c, LeadTheStampede))
-
-        if (dread_return_left == 0 or giant_left == 0) and draw_creatures == 0:
-            return False
-
-        if lands_num >= 2:
-            return True
-        if lands_num == 1 and mv1_tutor_num >= 1:
-            # we need to exclude the case Swamp + Sagu
-            if mv1_tutor_num == 1 and any(c for c in hand if isinstance(c, Swamp)) and any(c for c in hand if isinstance(c, SaguWildling)):
-                pass  # not a keep
-            else:
-                return True
-        # TODO: fix below: if land is Swamp some plays are not possible (e.g. Elves ramp)
-        # TODO: improve below: maybe some hands with Forest + Tinder Wall are keep?
-        if lands_num == 1 and free_mana_num >= 1 and mv2_tutor_num >= 1:
-            return True
-        if lands_num == 1 and mv1_dork_num >= 1 and mv2_tutor_num >= 1:
-            return True
-        if lands_num == 1 and mv1_dork_num >= 1 and mv2_draw >= 1:
-            return True
-        if lands_num == 0 and free_mana_num >= 1 and mv1_tutor_num >= 2:
-            return True
-        if lands_num == 0 and free_mana_num >= 1 and mv1_dork_num >= 1 and mv1_tutor_num >= 1 and mv2_tutor_num >= 1:
-            return True
-        if lands_num == 0 and free_mana_num >= 2 and mv1_tutor_num >= 1 and mv2_tutor_num >= 1:
-            return True
-
-        return False
+        return is_keep_hand(
+            get_category_counts(hand),
+            sum(1 for c in library if isinstance(c, DreadReturn)),
+            sum(1 for c in library if isinstance(c, LotlethGiant)),
+        )
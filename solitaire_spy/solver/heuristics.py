@@ -150,3 +150,105 @@ def no_useless_mana_switch_strategy(env, possible_actions):
     if len(possible_actions) == 2 and can_switch_mana_strategy and (can_pass or can_start_new_turn):
         return None, target_action
     return None, None
+
+# the heuristics, in priority order: get_obvious_action returns the first choice they make
+HEURISTICS = [
+    play_unique_action,
+    play_only_a_land,
+    tap_basic_land_for_mana,
+    cast_land_grant_for_free,
+    cast_lotus_petal,
+    no_useless_mana_switch_strategy,
+    cast_saruli_before_tapping_battlement,
+    cast_spell_if_only_option,
+    tutor_land_if_only_option,
+    mill_deck_with_spy,
+    flashback_giant_for_lethal,
+]
+
+def get_obvious_action(env, possible_actions):
+    # Same choice as trying HEURISTICS in order, with a single pass over possible_actions:
+    # each action is classified once, then the rules are applied by priority.
+    # possible_actions can be an iterator (see MtgEngine.iter_possible_actions): it is
+    # only consumed until the choice is certain
+    actions = []
+    non_system_actions = 0
+    non_system_action = None
+    free_land_grants = 0
+    free_land_grant = None
+    lotus_petal = None  # last one, as for the other "last" below
+    can_switch_mana_strategy = False
+    pass_or_new_turn_action = None
+    can_pass = False
+    saruli = None
+    can_tap_battlement = False
+    castable = None
+    tutorable = None
+    spy = None
+    can_flashback_dread_return = False
+    for card, action in possible_actions:
+        actions.append((card, action))
+        if action.startswith("system_"):
+            if action == "system_pass":
+                can_pass = True
+                pass_or_new_turn_action = action
+            elif action == "system_start_new_turn":
+                pass_or_new_turn_action = action
+            elif action == "system_switch_mana_strategy":
+                can_switch_mana_strategy = True
+        else:
+            non_system_actions += 1
+            non_system_action = action
+        if "cast" in action:
+            castable = card, action
+        if "cycling" in action or "roost_seek" in action:
+            tutorable = card, action
+        if isinstance(card, MTGLand):
+            if ((isinstance(card, Forest) and action == "tap_for_mana_G") or
+                    (isinstance(card, Swamp) and action == "tap_for_mana_B")):
+                # the only rules before this one need a single action, or a single
+                # non-system action that is a land play: the first basic tap wins
+                return card, action
+        elif isinstance(card, LandGrant):
+            if "for_free" in action:
+                free_land_grants += 1
+                free_land_grant = card, action
+        elif isinstance(card, LotusPetal):
+            if "cast" in action:
+                lotus_petal = card, action
+        elif isinstance(card, SaruliCaretaker):
+            if "cast" in action:
+                saruli = card, action
+        elif isinstance(card, OvergrownBattlement):
+            if "tap" in action:
+                can_tap_battlement = True
+        elif isinstance(card, BalustradeSpy):
+            spy = card, action
+        elif isinstance(card, DreadReturn):
+            if "flashback" in action:
+                can_flashback_dread_return = True
+
+    if len(actions) == 1:
+        return actions[0]
+    if non_system_actions == 1 and "play" in non_system_action:
+        return actions[0]
+    if free_land_grants == 1:
+        return free_land_grant
+    if lotus_petal:
+        return lotus_petal
+    only_two_actions = len(actions) == 2
+    if only_two_actions and can_switch_mana_strategy and pass_or_new_turn_action:
+        return None, pass_or_new_turn_action
+    if saruli and can_tap_battlement:
+        return saruli
+    if only_two_actions and can_pass and castable:
+        return castable
+    if only_two_actions and pass_or_new_turn_action and tutorable:
+        return tutorable
+    if spy:
+        card, action = mill_deck_with_spy(env, [spy])
+        if action is not None:
+            return card, action
+    if can_flashback_dread_return:
+        return flashback_giant_for_lethal(env, actions)
+    return None, None
@@ -0,0 +1,170 @@
+import itertools
+import logging
+from functools import lru_cache
+from math import comb
+
+from solitaire_spy.cards.creatures import *
+from solitaire_spy.cards.lands import *
+from solitaire_spy.cards.spells import *
+from solitaire_spy.constants import *
+from solitaire_spy.deck import get_card_class, get_deck_spec
+from solitaire_spy.log import get_logger
+
+log = get_logger(__name__, log_format="%(message)s", stdout_level=logging.INFO)
+
+# Keeping a hand only depends on how many cards of each category it has
+# (and on the Dread Return and Lotleth Giant left in the library)
+CATEGORIES = [
+    ("Swamp", (Swamp,)),  # Haunted Mire included
+    ("Land", (MTGLand, LandGrant)),
+    ("Lotus Petal", (LotusPetal,)),
+    ("Sagu Wildling", (SaguWildling,)),
+    ("MV1 tutor", (GenerousEnt, TrollOfKhazadDum)),
+    ("Elves of Deep Shadow", (ElvesOfDeepShadow,)),
+    ("Gatecreeper Vine", (GatecreeperVine,)),
+    ("Winding Way", (WindingWay,)),
+    ("Malevolent Rumble", (MalevolentRumble,)),
+    ("Lead the Stampede", (LeadTheStampede,)),
+    ("Dread Return", (DreadReturn,)),
+    ("Lotleth Giant", (LotlethGiant,)),
+    ("Dead card", (MesmericFiend, MaskedVandal)),
+    ("Other", ()),
+]
+(SWAMP, LAND, PETAL, SAGU, MV1_TUTOR, ELVES, VINE, WINDING_WAY, RUMBLE, STAMPEDE,
+ DREAD_RETURN, GIANT, DEAD, OTHER) = range(len(CATEGORIES))
+
+
+@lru_cache(maxsize=None)
+def get_card_class_category(card_class):
+    for i, (_, classes) in enumerate(CATEGORIES):
+        if issubclass(card_class, classes):
+            return i
+    return OTHER
+
+
+def get_category_counts(cards):
+    counts = [0] * len(CATEGORIES)
+    for card in cards:
+        counts[get_card_class_category(type(card))] += 1
+    return tuple(counts)
+
+
+def get_deck_category_counts(deck):
+    counts = [0] * len(CATEGORIES)
+    for card_name, quantity in get_deck_spec(deck).items():
+        counts[get_card_class_category(get_card_class(card_name))] += quantity
+    return tuple(counts)
+
+
+@lru_cache(maxsize=None)  # one entry per hand composition: a compiled keep table
+def is_keep_hand(hand_counts, dread_return_left, giant_left):
+    lands_num = hand_counts[SWAMP] + hand_counts[LAND]
+    free_mana_num = hand_counts[PETAL]
+    mv1_tutor_num = hand_counts[SAGU] + hand_counts[MV1_TUTOR]
+    mv1_dork_num = hand_counts[ELVES]
+    mv2_tutor_num = hand_counts[VINE]
+    mv2_draw = hand_counts[WINDING_WAY] + hand_counts[RUMBLE]
+    draw_creatures = hand_counts[WINDING_WAY] + hand_counts[STAMPEDE]
+
+    if (dread_return_left == 0 or giant_left == 0) and draw_creatures == 0:
+        return False
+
+    if lands_num >= 2:
+        return True
+    if lands_num == 1 and mv1_tutor_num >= 1:
+        # we need to exclude the case Swamp + Sagu
+        if mv1_tutor_num == 1 and hand_counts[SWAMP] > 0 and hand_counts[SAGU] > 0:
+            pass  # not a keep
+        else:
+            return True
+    if lands_num == 1 and free_mana_num >= 1 and mv2_tutor_num >= 1:
+        return True
+    if lands_num == 1 and mv1_dork_num >= 1 and mv2_tutor_num >= 1:
+        return True
+    if lands_num == 1 and mv1_dork_num >= 1 and mv2_draw >= 1:
+        return True
+    if lands_num == 0 and free_mana_num >= 1 and mv1_tutor_num >= 2:
+        return True
+    if lands_num == 0 and free_mana_num >= 1 and mv1_dork_num >= 1 and mv1_tutor_num >= 1 and mv2_tutor_num >= 1:
+        return True
+    if lands_num == 0 and free_mana_num >= 2 and mv1_tutor_num >= 1 and mv2_tutor_num >= 1:
+        return True
+
+    return False
+
+
+@lru_cache(maxsize=None)
+def get_bottom_choices(hand_names, cards_to_put_on_the_bottom):
+    # Hand indices to put on the bottom, one for each distinct multiset of names:
+    # the first combination in itertools order is kept, the others would lead
+    # to the same env
+    choices = {}
+    for nuple in itertools.combinations(range(len(hand_names)), cards_to_put_on_the_bottom):
+        choices.setdefault(tuple(sorted(hand_names[i] for i in nuple)), nuple)
+    return tuple(choices.values())
+
+
+def iter_hands(deck_counts, hand_size=INITIAL_HAND_SIZE):
+    # yields every hand, as category counts, with its multivariate hypergeometric probability
+    total = comb(sum(deck_counts), hand_size)
+
+    def _iter(i, cards_left, hand_counts, ways):
+        if i == len(deck_counts) - 1:
+            if cards_left <= deck_counts[i]:
+                yield hand_counts + (cards_left,), ways * comb(deck_counts[i], cards_left) / total
+            return
+        for k in range(min(cards_left, deck_counts[i]) + 1):
+            yield from _iter(i + 1, cards_left - k, hand_counts + (k,), ways * comb(deck_counts[i], k))
+
+    return _iter(0, hand_size, (), 1)
+
+
+def get_keep_probabilities(deck):
+    # Exact counterpart of Solver.start_with: each mulligan draws a fresh 7-card
+    # hand, kept if is_keep_hand (always at 3), then mull_to puts dead cards
+    # on the bottom first and branches on the other choices.
+    # Returns ({hand size: P(keep at)}, {hand size: {dead cards on the bottom: P}}).
+    deck_counts = get_deck_category_counts(deck)
+    keep_7 = 0
+    dead_cards = {}  # dead cards in hand: probability
+    for hand_counts, p in iter_hands(deck_counts):
+        if is_keep_hand(
+                hand_counts,
+                deck_counts[DREAD_RETURN] - hand_counts[DREAD_RETURN],
+                deck_counts[GIANT] - hand_counts[GIANT],
+        ):
+            keep_7 += p
+        dead = hand_counts[GIANT] + hand_counts[DREAD_RETURN] + hand_counts[DEAD]
+        dead_cards[dead] = dead_cards.get(dead, 0) + p
+
+    keep_probabilities = {}
+    not_kept = 1
+    for hand_size in range(INITIAL_HAND_SIZE, 3, -1):
+        keep_probabilities[hand_size] = not_kept * keep_7
+        not_kept *= 1 - keep_7
+    keep_probabilities[3] = not_kept
+
+    dead_bottoms = {}
+    for hand_size in range(INITIAL_HAND_SIZE, 2, -1):
+        bottoms = INITIAL_HAND_SIZE - hand_size
+        dead_bottoms[hand_size] = {}
+        for dead, p in dead_cards.items():
+            forced = min(dead, bottoms)  # the remaining bottoms are branched by the solver
+            dead_bottoms[hand_size][forced] = dead_bottoms[hand_size].get(forced, 0) + p
+    return keep_probabilities, dead_bottoms
+
+
+def log_keep_probabilities(deck):
+    keep_probabilities, dead_bottoms = get_keep_probabilities(deck)
+    for hand_size, p in keep_probabilities.items():
+        log.info(f"Hands kept at {hand_size}: {p * 100:.2f}%")
+    for hand_size in range(INITIAL_HAND_SIZE, 3, -1):
+        p = sum(keep_probabilities[i] for i in range(hand_size, INITIAL_HAND_SIZE + 1))
+        log.info(f"Hands kept at {hand_size}+: {p * 100:.2f}%")
+    for hand_size in range(INITIAL_HAND_SIZE - 1, 2, -1):
+        bottoms = INITIAL_HAND_SIZE - hand_size
+        line = ", ".join(
+            f"{forced}/{bottoms}: {p * 100:.2f}%" for forced, p in sorted(dead_bottoms[hand_size].items())
+        )
+        log.info(f"Dead cards on the bottom at {hand_size}: {line}")
+    return keep_probabilities, dead_bottoms
@@ -0,0 +1,266 @@
+import math
+import random
+import timeit
+from copy import deepcopy
+import logging
+
+from solitaire_spy.constants import *
+from solitaire_spy.mtg_engine import GameLostException
+from solitaire_spy.solver.core import Solver, copy_env_with_card
+from solitaire_spy.spy_solitaire import MTGSolitaire
+
+from solitaire_spy.log import get_logger
+
+log = get_logger(__name__, stdout_level=logging.WARNING)
+
+
+class MCTSNode:
+    def __init__(self, env, parent=None):
+        self.env = env  # no obvious action left to play (see MCTSSolver._settle)
+        self.parent = parent
+        self.children = []
+        self.untried_actions = None  # greedified actions, set on the first visit
+        self.visits = 0
+        self.wins = 0
+        self.reward = 0.0
+        self.terminal_reward = None  # set on won or lost envs
+        self.exhausted = False  # the whole subtree has been expanded
+
+    def ucb(self, exploration):
+        return self.reward / self.visits + exploration * math.sqrt(math.log(self.parent.visits) / self.visits)
+
+
+class MCTSSolver(Solver):
+    # Anytime Monte Carlo Tree Search over the same actions the BFS Solver explores.
+    # Obvious actions are played right away (in the tree and in the playouts) and
+    # the other actions are greedified: the heuristics are the policy, random
+    # choices only happen among the actions they leave open.
+    # Wins are rewarded MIN_TURN_WIN_POSSIBLE / turn, so that earlier wins are preferred.
+    # The tree is played in one determinized world: every env gets the same shuffle_seed,
+    # so a shuffle resolves the same way in every expansion and playout that reaches it,
+    # and many playouts cannot fish for a lucky library.
+    def __init__(self, env: MTGSolitaire, exploration=MCTS_EXPLORATION):
+        super().__init__(env)
+        self.exploration = exploration
+        # policy choices do not touch the global random state, which shuffles the libraries
+        self.rng = random.Random(random.getrandbits(32))
+        self.shuffle_seed = self.rng.getrandbits(32)
+        self.with_lucky_wins = True
+        self.best_env = None  # earliest win found so far
+        self.best_node = None  # tree node whose visit found best_env
+        self.nodes = 0
+
+    def solve(self, start_time=None, with_lucky_wins=True, initial_hand_size=None,
+              max_runtime=None, max_nodes=None):
+        # Returns (result, env, confidence). On EXECUTION_SUCCEEDED env is the earliest
+        # win found and confidence is the share of other worlds in which the same kept
+        # hand also wins by that turn (see _get_confidence).
+        # On EXECUTION_TIMEOUT (budget spent, no win) env ends the most visited line.
+        # EXECUTION_FAILED means that the whole tree was expanded without a win.
+        if start_time is None:
+            start_time = timeit.default_timer()
+        # budgets are read from this module at call time, so that they can be patched
+        if max_runtime is None:
+            max_runtime = MCTS_MAX_RUNTIME
+        if max_nodes is None:
+            max_nodes = MCTS_MAX_NODES
+        self.with_lucky_wins = with_lucky_wins
+        if not initial_hand_size:
+            self.keep_and_mull()
+        else:
+            self.start_with(initial_hand_size)
+        kept_envs = self.env_queues[0]
+        self.env_queues.clear()
+
+        # the rest of the budget measures the confidence of a win
+        root, kept_envs = self._search(
+            kept_envs,
+            start_time,
+            max_runtime * (1 - MCTS_CONFIDENCE_BUDGET_SHARE),
+            int(max_nodes * (1 - MCTS_CONFIDENCE_BUDGET_SHARE)),
+            MIN_TURN_WIN_POSSIBLE,
+        )
+        if self.best_env:
+            kept_hand = self.best_node
+            while kept_hand.parent is not root:
+                kept_hand = kept_hand.parent
+            confidence = self._get_confidence(
+                kept_envs[kept_hand],
+                self.best_env.counter_turn,
+                max(0.0, max_runtime - (timeit.default_timer() - start_time)),
+                int(max_nodes * MCTS_CONFIDENCE_BUDGET_SHARE),
+            )
+            return EXECUTION_SUCCEEDED, self.best_env, confidence
+        if root.exhausted:
+            return EXECUTION_FAILED, None, 1.0
+        node = root
+        while node.children:
+            node = max(node.children, key=lambda c: c.visits)
+        return EXECUTION_TIMEOUT, node.env, 0.0
+
+    def _search(self, kept_envs, start_time, max_runtime, max_nodes, target_turn):
+        # Searches the tree of the kept hands until a win by target_turn or the budgets.
+        # Returns the root and, per kept hand node, its env before any step.
+        root = MCTSNode(None)
+        root.untried_actions = []  # its children are the kept hands
+        start_envs = {}
+        for env in kept_envs:
+            env.initial_hand = deepcopy(env.hand)
+            env.shuffle_seed = self.shuffle_seed
+            start_env = deepcopy(env)
+            child = self._new_node(env, root)
+            if child:
+                start_envs[child] = start_env
+                root.children.append(child)
+                if child.terminal_reward is not None:
+                    self._backpropagate(child, child.terminal_reward)
+                else:
+                    self._backpropagate(child, self._rollout(env, child))
+        self._update_exhausted(root)
+
+        while not root.exhausted:
+            if self.best_env and self.best_env.counter_turn <= target_turn:
+                log.info(f"MCTS: found a win by turn {target_turn}")
+                break
+            if timeit.default_timer() - start_time > max_runtime:
+                log.info(f"MCTS: reached maximum computation time ({max_runtime:.2f} s)")
+                break
+            if self.nodes >= max_nodes:
+                log.info(f"MCTS: reached maximum number of nodes ({max_nodes})")
+                break
+            node = self._select(root)
+            if node.terminal_reward is not None:
+                reward = node.terminal_reward
+            else:
+                reward = self._rollout(node.env, node)
+            self._backpropagate(node, reward)
+
+        log.info(f"MCTS: {root.visits} playouts, {self.nodes} nodes")
+        return root, start_envs
+
+    def _get_confidence(self, kept_env, win_turn, max_runtime, max_nodes):
+        # The win could be an artifact of the shuffles of this world: searches the same
+        # kept hand in MCTS_CONFIDENCE_WORLDS other worlds (shuffle seeds), with a share
+        # of the remaining budget each, and returns the share of them that win by win_turn.
+        # Short searches can miss wins: the confidence is a lower bound.
+        wins = 0
+        deadline = timeit.default_timer() + max_runtime
+        for i in range(MCTS_CONFIDENCE_WORLDS):
+            env = deepcopy(kept_env)
+            solver = MCTSSolver(env, self.exploration)
+            solver.rng = random.Random(self.rng.getrandbits(32))
+            solver.shuffle_seed = self.rng.getrandbits(32)
+            solver.with_lucky_wins = self.with_lucky_wins
+            world_start_time = timeit.default_timer()
+            solver._search(
+                [env],
+                world_start_time,
+                max(0.0, deadline - world_start_time) / (MCTS_CONFIDENCE_WORLDS - i),
+                max_nodes // MCTS_CONFIDENCE_WORLDS,
+                win_turn,
+            )
+            if solver.best_env and solver.best_env.counter_turn <= win_turn:
+                wins += 1
+        return wins / MCTS_CONFIDENCE_WORLDS
+
+    def _new_node(self, env, parent):
+        # returns None if env is a duplicate of an explored state
+        node = MCTSNode(env, parent)
+        try:
+            self._settle(node)
+        except GameLostException:
+            node.terminal_reward = 0.0
+        if node.terminal_reward is None:
+            env_hash = env.functional_hash
+            if env_hash in self.explored_hashes:
+                log.debug("Optimization (hash): branch already explored")
+                return None
+            self.explored_hashes.add(env_hash)
+        self.nodes += 1
+        return node
+
+    def _settle(self, node):
+        # plays the obvious actions, as the BFS Solver does before branching
+        env = node.env
+        while True:
+            if env.opponent_counter_life <= 0:
+                node.terminal_reward = self._get_win_reward(env, node)
+                return
+            if env.counter_turn >= MAX_TURN:
+                node.terminal_reward = 0.0
+                return
+            card, action = self._get_obvious_action(env, env.engine.iter_possible_actions())
+            if action is None:
+                return
+            self._step(env, card, action)
+
+    def _get_win_reward(self, env, node):
+        if not self.with_lucky_wins and env.unknown_lands_in_deck_on_combo > 0:
+            log.debug("Ignoring lucky win...")
+            return 0.0
+        if self.best_env is None or env.counter_turn < self.best_env.counter_turn:
+            log.info(f"MCTS: win at turn {env.counter_turn} (keep at {env.kept_at})")
+            self.best_env = env
+            self.best_node = node
+        return MIN_TURN_WIN_POSSIBLE / max(env.counter_turn, MIN_TURN_WIN_POSSIBLE)
+
+    def _get_actions(self, env):
+        return self.greedify_action(env, env.engine.get_possible_actions())
+
+    def _select(self, node):
+        # descends by UCB to a node with untried actions and expands one of them
+        while True:
+            if node.untried_actions is None:
+                node.untried_actions = self._get_actions(node.env)
+            while node.untried_actions:
+                card, action = node.untried_actions.pop(self.rng.randrange(len(node.untried_actions)))
+                child = self._expand(node, card, action)
+                if child:
+                    node.children.append(child)
+                    return child
+            children = [c for c in node.children if not c.exhausted]
+            if not children:
+                return node  # every action leads to an explored state: playout from here
+            node = max(children, key=lambda c: c.ucb(self.exploration))
+
+    def _expand(self, node, card, action):
+        new_env, card = copy_env_with_card(node.env, card)
+        try:
+            self._step(new_env, card, action)
+        except GameLostException:
+            child = MCTSNode(new_env, node)
+            child.terminal_reward = 0.0
+            self.nodes += 1
+            return child
+        return self._new_node(new_env, node)
+
+    def _rollout(self, env, node):
+        env = deepcopy(env)
+        try:
+            for _ in range(MCTS_MAX_ROLLOUT_STEPS):
+                if env.opponent_counter_life <= 0:
+                    return self._get_win_reward(env, node)
+                if env.counter_turn >= MAX_TURN:
+                    return 0.0
+                possible_actions = env.engine.get_possible_actions()
+                card, action = self._get_obvious_action(env, possible_actions)
+                if action is None:
+                    card, action = self.rng.choice(self.greedify_action(env, possible_actions))
+                self._step(env, card, action)
+        except GameLostException:
+            pass
+        return 0.0
+
+    def _backpropagate(self, node, reward):
+        while node is not None:
+            node.visits += 1
+            node.reward += reward
+            node.wins += reward > 0
+            self._update_exhausted(node)
+            node = node.parent
+
+    @staticmethod
+    def _update_exhausted(node):
+        node.exhausted = node.terminal_reward is not None or (
+            node.untried_actions == [] and all(c.exhausted for c in node.children)
+        )
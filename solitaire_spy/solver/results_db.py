@@ -0,0 +1,320 @@
+import logging
+import os
+import pickle
+import re
+import sqlite3
+import sys
+from functools import reduce
+from operator import mul
+
+from solitaire_spy.constants import *
+from solitaire_spy.deck import get_deck_spec
+from solitaire_spy.log import get_logger
+from solitaire_spy.solver.simulator import get_t1_mana
+
+log = get_logger(__name__, log_format="%(message)s", stdout_level=logging.INFO)
+
+# Indexed database of the Simulator results: decks (card quantities), runs (one per
+# results pickle, i.e. deck and settings) and games (one per SimulationSummary).
+# Pickles stay the source of truth: import_results (re-)imports the new and updated ones.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decks (
+    deck_hash TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS deck_cards (
+    deck_hash TEXT NOT NULL REFERENCES decks(deck_hash),
+    card_name TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (deck_hash, card_name)
+);
+CREATE INDEX IF NOT EXISTS deck_cards_card ON deck_cards (card_name, quantity);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deck_hash TEXT NOT NULL REFERENCES decks(deck_hash),
+    initial_hand_size INTEGER NOT NULL,
+    with_lucky_wins INTEGER NOT NULL,
+    blind_spy_odds INTEGER NOT NULL,
+    mcts INTEGER NOT NULL,
+    num_sim INTEGER NOT NULL,
+    pkl_file TEXT NOT NULL UNIQUE,
+    pkl_mtime REAL NOT NULL,
+    UNIQUE (deck_hash, initial_hand_size, with_lucky_wins, blind_spy_odds, mcts)
+);
+CREATE INDEX IF NOT EXISTS runs_settings ON runs (initial_hand_size, with_lucky_wins, blind_spy_odds, mcts);
+CREATE TABLE IF NOT EXISTS games (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    game INTEGER NOT NULL,
+    kept_at INTEGER NOT NULL,
+    won INTEGER NOT NULL,
+    counter_turn INTEGER NOT NULL,
+    cards_in_library INTEGER NOT NULL,
+    unknown_lands_in_deck_on_combo INTEGER NOT NULL,
+    interaction_count INTEGER NOT NULL,
+    t1_mana INTEGER NOT NULL,
+    solving_time REAL NOT NULL,
+    blind_spy_odds REAL NOT NULL,
+    blind_spy_turn INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    PRIMARY KEY (run_id, game)
+);
+CREATE INDEX IF NOT EXISTS games_won ON games (run_id, won, counter_turn);
+"""
+
+# <deck hash>[_no_lw][_bso][_mcts][_hsN].pkl, as named by Simulator
+PKL_FILE_PATTERN = re.compile(r"^([0-9a-f]{40})(_no_lw)?(_bso)?(_mcts)?(?:_hs(\d+))?\.pkl$")
+
+NO_INITIAL_HAND_SIZE = 0  # runs where the solver chooses between keeping and mulliganing
+
+
+def get_game_row(run_id, game, summary):
+    # kept_at -1 is a mulligan, and a kept game is won if the opponent is dead (see
+    # Simulator._get_summaries_by_type). Attributes added later get their load defaults.
+    kept_at = summary.kept_at
+    won = kept_at != -1 and getattr(summary, "opponent_counter_life", 0) <= 0
+    return (
+        run_id,
+        game,
+        kept_at,
+        won,
+        summary.counter_turn,
+        summary.cards_in_library,
+        summary.unknown_lands_in_deck_on_combo,
+        summary.interaction_count,
+        get_t1_mana(summary.initial_hand),
+        summary.solving_time,
+        getattr(summary, "blind_spy_odds", 0.0),
+        getattr(summary, "blind_spy_turn", -1),
+        getattr(summary, "confidence", 1.0),
+    )
+
+
+class ResultsDatabase:
+    def __init__(self, db_file=RESULTS_DB_PATH):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(db_file, timeout=60, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def import_results(self, results_path=RESULTS_PATH):
+        # imports the results pickles that are new or changed since their last import
+        imported = 0
+        for file_name in sorted(os.listdir(results_path)):
+            match = PKL_FILE_PATTERN.match(file_name)
+            if not match:
+                continue  # e.g. solution caches
+            pkl_file = os.path.join(results_path, file_name)
+            mtime = os.path.getmtime(pkl_file)
+            row = self.connection.execute(
+                "SELECT pkl_mtime FROM runs WHERE pkl_file = ?", (file_name,)
+            ).fetchone()
+            if row is not None and row[0] == mtime:
+                continue
+            deck_hash, no_lw, bso, mcts, initial_hand_size = match.groups()
+            with open(pkl_file, "rb") as f:
+                simulator = pickle.load(f)
+            # older pickles only have the deck as a list of cards
+            deck_spec = get_deck_spec(getattr(simulator, "deck_spec", None) or simulator.deck)
+            self.add_run(
+                file_name, mtime, deck_hash, deck_spec, simulator.summaries,
+                initial_hand_size=int(initial_hand_size) if initial_hand_size else None,
+                with_lucky_wins=not no_lw and not bso,  # older _bso files dropped lucky wins too
+                blind_spy_odds=bool(bso),
+                mcts=bool(mcts),
+                num_sim=simulator.num_sim,
+            )
+            imported += 1
+        log.info(f"Imported {imported} results files into {self.db_file}")
+        return imported
+
+    def add_run(self, pkl_file, pkl_mtime, deck_hash, deck_spec, summaries, initial_hand_size=None,
+                with_lucky_wins=True, blind_spy_odds=False, mcts=False, num_sim=None):
+        # replaces the run with the same pkl_file or settings, if any. Returns the run id
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.execute("INSERT OR IGNORE INTO decks (deck_hash) VALUES (?)", (deck_hash,))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO deck_cards (deck_hash, card_name, quantity) VALUES (?, ?, ?)",
+                [(deck_hash, card_name, quantity) for card_name, quantity in deck_spec.items()],
+            )
+            settings = (deck_hash, initial_hand_size or NO_INITIAL_HAND_SIZE, with_lucky_wins, blind_spy_odds, mcts)
+            self.connection.execute(
+                "DELETE FROM games WHERE run_id IN (SELECT id FROM runs WHERE pkl_file = ? OR ("
+                "deck_hash = ? AND initial_hand_size = ? AND with_lucky_wins = ? AND blind_spy_odds = ? AND mcts = ?))",
+                (pkl_file, *settings),
+            )
+            self.connection.execute(
+                "DELETE FROM runs WHERE pkl_file = ? OR ("
+                "deck_hash = ? AND initial_hand_size = ? AND with_lucky_wins = ? AND blind_spy_odds = ? AND mcts = ?)",
+                (pkl_file, *settings),
+            )
+            cursor = self.connection.execute(
+                "INSERT INTO runs (deck_hash, initial_hand_size, with_lucky_wins, blind_spy_odds, mcts, "
+                "num_sim, pkl_file, pkl_mtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*settings, num_sim if num_sim is not None else len(summaries), pkl_file, pkl_mtime),
+            )
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [get_game_row(run_id, i, s) for i, s in enumerate(summaries)],
+            )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return run_id
+
+    def get_run_id(self, deck_hash, initial_hand_size=None, with_lucky_wins=True, blind_spy_odds=False,
+                   mcts=False):
+        # None if the run was never imported
+        row = self.connection.execute(
+            "SELECT id FROM runs WHERE deck_hash = ? AND initial_hand_size = ? AND with_lucky_wins = ? "
+            "AND blind_spy_odds = ? AND mcts = ?",
+            (deck_hash, initial_hand_size or NO_INITIAL_HAND_SIZE, with_lucky_wins, blind_spy_odds, mcts),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _group_by(self, run_id, column, condition):
+        return dict(self.connection.execute(
+            f"SELECT {column}, COUNT(*) FROM games WHERE run_id = ? AND {condition} GROUP BY {column}",
+            (run_id,),
+        ).fetchall())
+
+    def get_stats(self, run_id):
+        # the numbers of Simulator.log_stats, as counts: percentages are over "games".
+        # Per-turn counts cover every turn, log_stats only prints the turns before the last win.
+        (games, wins, mulligans, lucky_wins, zero_cards_left, blind_spy_wins, mcts_confidence,
+         average_solving_time) = self.connection.execute(
+            "SELECT COUNT(*), TOTAL(won), TOTAL(kept_at = -1), "
+            "TOTAL(won AND unknown_lands_in_deck_on_combo > 0 AND kept_at > 0), "
+            "TOTAL(won AND cards_in_library = 0), "
+            "TOTAL(CASE WHEN NOT won AND blind_spy_odds > 0 THEN blind_spy_odds END), "
+            "COALESCE(AVG(CASE WHEN won AND kept_at > 0 THEN confidence END), 0), "
+            "AVG(CASE WHEN kept_at != -1 THEN solving_time END) "
+            "FROM games WHERE run_id = ?",
+            (run_id,),
+        ).fetchone()
+        games_won_at_turn = self._group_by(run_id, "counter_turn", "won")
+        interactions_at_turn = {}
+        for turn, interaction_count, count in self.connection.execute(
+                "SELECT counter_turn, interaction_count, COUNT(*) FROM games "
+                "WHERE run_id = ? AND won AND interaction_count BETWEEN 0 AND ? "
+                "GROUP BY counter_turn, interaction_count",
+                (run_id, MAX_INTERACTION_CARDS_IN_DECK - 1),
+        ):
+            interactions_at_turn.setdefault(turn, {})[interaction_count] = count
+        hands_kept_at = self._group_by(run_id, "kept_at", "kept_at != -1")
+        t1_mana = self._group_by(run_id, "t1_mana", "kept_at != -1")
+        blind_spy_wins_at_turn = dict(self.connection.execute(
+            "SELECT blind_spy_turn, TOTAL(blind_spy_odds) FROM games "
+            "WHERE run_id = ? AND NOT won AND blind_spy_odds > 0 GROUP BY blind_spy_turn",
+            (run_id,),
+        ).fetchall())
+        return {
+            "games": games,
+            "games_won_at_turn": games_won_at_turn,
+            "games_won_by_turn": {
+                turn: sum(n for t, n in games_won_at_turn.items() if t <= turn)
+                for turn in range(MIN_TURN_WIN_POSSIBLE, MAX_TURN + 1)
+            },
+            "interactions_at_turn": interactions_at_turn,
+            "hands_kept_at": {i: hands_kept_at.get(i, 0) for i in range(3, INITIAL_HAND_SIZE + 1)},
+            "hands_kept_at_plus": {
+                i: sum(hands_kept_at.get(j, 0) for j in range(i, INITIAL_HAND_SIZE + 1))
+                for i in range(3, INITIAL_HAND_SIZE + 1)
+            },
+            "t1_mana": {i: t1_mana.get(i, 0) for i in range(1, INITIAL_HAND_SIZE + 1)},
+            "t1_mana_plus": {
+                i: sum(t1_mana.get(j, 0) for j in range(i, INITIAL_HAND_SIZE + 1))
+                for i in range(1, INITIAL_HAND_SIZE + 1)
+            },
+            "zero_cards_left": int(zero_cards_left),
+            "one_plus_cards_left": int(wins - zero_cards_left),
+            "scientific_wins": int(wins - lucky_wins),
+            "lucky_wins": int(lucky_wins),
+            "mulligans": int(mulligans),
+            "lucky_wins_at_turn": self._group_by(
+                run_id, "counter_turn", "won AND unknown_lands_in_deck_on_combo > 0"
+            ),
+            "blind_spy_wins": blind_spy_wins,
+            "blind_spy_wins_at_turn": blind_spy_wins_at_turn,
+            "mcts_confidence": mcts_confidence,
+            "average_solving_time": average_solving_time,
+        }
+
+    def get_win_probabilities(self, deck_hash, with_lucky_wins=True, blind_spy_odds=False, mcts=False):
+        # the numbers of Simulator.log_aggregated_stats: {turn: P(win at turn)}, where
+        # MAX_TURN stands for MAX_TURN+. Needs the runs of every initial hand size.
+        rows = self.connection.execute(
+            "SELECT r.initial_hand_size, COUNT(*), TOTAL(g.kept_at = -1) FROM runs r "
+            "JOIN games g ON g.run_id = r.id WHERE r.deck_hash = ? AND r.initial_hand_size BETWEEN 3 AND ? "
+            "AND r.with_lucky_wins = ? AND r.blind_spy_odds = ? AND r.mcts = ? GROUP BY r.initial_hand_size",
+            (deck_hash, INITIAL_HAND_SIZE, with_lucky_wins, blind_spy_odds, mcts),
+        ).fetchall()
+        games = {hand_size: n for hand_size, n, _ in rows}
+        mulligans = {hand_size: m for hand_size, _, m in rows}
+        if len(games) != INITIAL_HAND_SIZE - 2:
+            raise ValueError(f"Missing initial hand sizes for deck {deck_hash}: {sorted(games)} imported")
+        if len(set(games.values())) != 1:
+            raise Exception("Unequal number of summaries across simulations")
+        wins = {hand_size: {} for hand_size in games}
+        for hand_size, turn, count in self.connection.execute(
+                "SELECT r.initial_hand_size, g.counter_turn, COUNT(*) FROM runs r "
+                "JOIN games g ON g.run_id = r.id WHERE r.deck_hash = ? AND r.initial_hand_size BETWEEN 3 AND ? "
+                "AND r.with_lucky_wins = ? AND r.blind_spy_odds = ? AND r.mcts = ? AND g.won "
+                "GROUP BY r.initial_hand_size, g.counter_turn",
+                (deck_hash, INITIAL_HAND_SIZE, with_lucky_wins, blind_spy_odds, mcts),
+        ):
+            wins[hand_size][turn] = count
+
+        probabilities = {}
+        for i in range(MIN_TURN_WIN_POSSIBLE, MAX_TURN):
+            prob_win_at_turn_i = 0
+            prob_mulls = []
+            for j in range(INITIAL_HAND_SIZE, 2, -1):
+                hands_kept_at_j = games[j] - mulligans[j]
+                p_keep_at_j = hands_kept_at_j / games[j]
+                p_mull_before_j = reduce(mul, prob_mulls, 1)
+                prob_win_at_turn_i += p_mull_before_j * p_keep_at_j * wins[j].get(i, 0) / hands_kept_at_j
+                prob_mulls.append(1 - p_keep_at_j)
+            probabilities[i] = prob_win_at_turn_i
+        probabilities[MAX_TURN] = 1 - sum(probabilities.values())
+        return probabilities
+
+    def get_win_rates(self, turn, card_counts=None, initial_hand_size=None, with_lucky_wins=True,
+                      blind_spy_odds=False, mcts=False):
+        # [(deck hash, games won by turn / games)] of the runs with these settings, best first.
+        # card_counts {card name: quantity} only keeps the decks with those quantities (0: none).
+        query = (
+            "SELECT r.deck_hash, TOTAL(g.won AND g.counter_turn <= ?) / COUNT(*) AS rate "
+            "FROM runs r JOIN games g ON g.run_id = r.id "
+            "WHERE r.initial_hand_size = ? AND r.with_lucky_wins = ? AND r.blind_spy_odds = ? AND r.mcts = ?"
+        )
+        args = [turn, initial_hand_size or NO_INITIAL_HAND_SIZE, with_lucky_wins, blind_spy_odds, mcts]
+        for card_name, quantity in (card_counts or {}).items():
+            query += (
+                " AND COALESCE((SELECT quantity FROM deck_cards c "
+                "WHERE c.deck_hash = r.deck_hash AND c.card_name = ?), 0) = ?"
+            )
+            args += [card_name, quantity]
+        query += " GROUP BY r.id ORDER BY rate DESC, r.deck_hash"
+        return self.connection.execute(query, args).fetchall()
+
+    def get_decks_beating(self, baseline_deck_hash, turn, card_counts=None, **settings):
+        # [(deck hash, win rate by turn)] of the decks winning by turn more often than
+        # the baseline deck, with the same settings (see get_win_rates)
+        win_rates = self.get_win_rates(turn, card_counts, **settings)
+        baseline = dict(self.get_win_rates(turn, **settings)).get(baseline_deck_hash)
+        if baseline is None:
+            raise ValueError(f"No results imported for baseline deck {baseline_deck_hash}")
+        return [(deck_hash, rate) for deck_hash, rate in win_rates if rate > baseline]
+
+
+if __name__ == '__main__':
+    database = ResultsDatabase(sys.argv[1] if len(sys.argv) > 1 else RESULTS_DB_PATH)
+    try:
+        database.import_results()
+    finally:
+        database.close()
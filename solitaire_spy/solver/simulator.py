@@ -1,27 +1,41 @@
+import cProfile
 import logging
+import multiprocessing
 import os
 import pickle
+import pstats
+import random
+import time
 import timeit
 from functools import reduce
 from operator import mul
-from collections import defaultdict, Counter
-from copy import deepcopy
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import defaultdict
 from itertools import groupby
+from multiprocessing.connection import wait
 
 from solitaire_spy.cards.creatures import *
 from solitaire_spy.cards.mtg_cards import MTGLand
 from solitaire_spy.cards.spells import LotusPetal, LandGrant
 from solitaire_spy.constants import *
-from solitaire_spy.deck import get_deck_diff, get_deck_hash
+from solitaire_spy.deck import get_deck_diff, get_deck_hash, get_deck_spec, build_deck
 from solitaire_spy.log import get_logger
-from solitaire_spy.solver.core import Solver
+from solitaire_spy.solver.cache import SolutionCache, get_worker_solution_cache, init_worker_solution_cache
+import solitaire_spy.solver.core as core
+from solitaire_spy.solver.core import Solver, get_memory_usage_mb
+from solitaire_spy.solver.mcts import MCTSSolver
 from solitaire_spy.spy_solitaire import MTGSolitaire
 
 log = get_logger(__name__, log_format="%(message)s", stdout_level=logging.INFO)
 
+# cards that count as (pseudo-)mana in the initial hand
+T1_MANA_CARDS = (MTGLand, LotusPetal, TrollOfKhazadDum, GenerousEnt, LandGrant, SaguWildling)
+
+
+def get_t1_mana(initial_hand):
+    return sum(1 for c in initial_hand if isinstance(c, T1_MANA_CARDS))
+
 class SimulationSummary:
-    def __init__(self, env, solving_time):
+    def __init__(self, env, solving_time, blind_spy_odds=0.0, blind_spy_turn=-1, confidence=1.0, result=None):
         if env:
             self.initial_hand = env.initial_hand
             self.kept_at = env.kept_at
@@ -31,18 +45,28 @@ class SimulationSummary:
             self.mulled_bottom = env.mulled_bottom
             self.interaction_count = env.interaction_count
             self.steps_log = env.steps_log
+            self.shuffle_log = env.shuffle_log
             self.opponent_counter_life = env.opponent_counter_life
         else:
             self.initial_hand = []
-            self.kept_at = -1
+            # -1 is a mulligan: a game killed by the WorkerWatchdog was played, but its keep is unknown
+            self.kept_at = 0 if result == EXECUTION_BUDGET_EXCEEDED else -1
             self.counter_turn = -1
             self.cards_in_library = -1
             self.unknown_lands_in_deck_on_combo = -1
             self.mulled_bottom = []
             self.interaction_count = -1
             self.steps_log = []
+            self.shuffle_log = []
             self.opponent_counter_life = 999
         self.solving_time = solving_time
+        # best chance of winning with a blind Spy (only with Simulator(blind_spy_odds=True)),
+        # a lower bound: Dread Returns in hand are not counted (see combo.evaluate_blind_spy)
+        self.blind_spy_odds = blind_spy_odds
+        self.blind_spy_turn = blind_spy_turn
+        # 1.0 for the exhaustive Solver, MCTS confidence otherwise (see MCTSSolver.solve)
+        self.confidence = confidence
+        self.result = result  # EXECUTION_* code of the solve
 
     def __str__(self):
         return (f"Initial hand: {self.initial_hand}\n"
@@ -50,63 +74,193 @@ class SimulationSummary:
                 f"Win at turn: {self.counter_turn}\n"
                 f"Cards in library: {self.cards_in_library}\n"
                 f"Unknown lands in deck on combo: {self.unknown_lands_in_deck_on_combo}\n"
+                f"Blind Spy odds: {self.blind_spy_odds:.4f} (turn {self.blind_spy_turn})\n"
+                f"Confidence: {self.confidence:.4f}\n"
                 f"Interaction count: {self.interaction_count}\n"
                 f"Steps log: {self.steps_log}")
 
 
 class ParallelSolver:
-    def __init__(self, deck):
-        self.deck = deepcopy(deck)
+    def __init__(self, deck_spec):
+        self.deck_spec = deck_spec
 
-    def run(self, i, with_lucky_wins, initial_hand_size):
+    def run(self, i, with_lucky_wins, initial_hand_size, blind_spy_odds=False, solution_cache=False, mcts=False,
+            seed=None):
         log.debug(f"Running simulation #{i+1}")
+        if seed is not None:  # reproducible game, whatever worker or host runs it
+            random.seed(seed)
         solver_start_time = timeit.default_timer()
-        result, env = Solver(MTGSolitaire(self.deck, None)).solve(
+        deck = build_deck(self.deck_spec)  # cards are instantiated only here
+        if mcts:
+            return self._run_mcts(deck, solver_start_time, with_lucky_wins, initial_hand_size)
+        cache = get_worker_solution_cache() if solution_cache else None
+        solver = Solver(MTGSolitaire(deck, None), solution_cache=cache)
+        result, env = solver.solve(
             early_abort=False,
             start_time=solver_start_time,
             with_lucky_wins=with_lucky_wins,
             initial_hand_size=initial_hand_size,
+            blind_spy_odds=blind_spy_odds,
         )
         solving_time = timeit.default_timer() - solver_start_time
-        if result == EXECUTION_TIMEOUT or result == EXECUTION_TRUNCATED or result == EXECUTION_SUCCEEDED:
+        if cache:
+            cache.flush()
+        if result in (EXECUTION_TIMEOUT, EXECUTION_TRUNCATED, EXECUTION_SUCCEEDED, EXECUTION_BUDGET_EXCEEDED):
             # we have an env
-            summary = SimulationSummary(env, solving_time)
+            summary = SimulationSummary(env, solving_time, solver.blind_spy_odds, solver.blind_spy_turn,
+                                        result=result)
             return summary
         # result == EXECUTION_FAILED
         elif initial_hand_size:  # we need to track mulls here
-            summary = SimulationSummary(None, solving_time)
+            summary = SimulationSummary(None, solving_time, solver.blind_spy_odds, solver.blind_spy_turn,
+                                        result=result)
             return summary
         else:
             return None
 
-def run_instance_method(args):
-    # helper function for pickling: unwraps the instance + method call
-    instance, method_name, arg = args
-    method = getattr(instance, method_name)
-    return method(*arg)
+    def _run_mcts(self, deck, solver_start_time, with_lucky_wins, initial_hand_size):
+        solver = MCTSSolver(MTGSolitaire(deck, None))
+        result, env, confidence = solver.solve(
+            start_time=solver_start_time,
+            with_lucky_wins=with_lucky_wins,
+            initial_hand_size=initial_hand_size,
+        )
+        solving_time = timeit.default_timer() - solver_start_time
+        if env or initial_hand_size:  # we need to track mulls here
+            return SimulationSummary(env, solving_time, confidence=confidence, result=result)
+        return None
+
+    def run_profiled(self, *args):
+        # runs in the worker: raw cProfile stats are returned to be merged by the parent
+        profiler = cProfile.Profile()
+        summary = profiler.runcall(self.run, *args)
+        profiler.create_stats()
+        return summary, profiler.stats
+
+
+class WorkerProfile:
+    # the minimal interface pstats.Stats needs to load stats collected by a worker
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _run_game(connection, method, args):
+    # game process entry point: the result (or the exception) goes back to the parent
+    try:
+        connection.send(method(*args))
+    except Exception as e:
+        connection.send(e)
+    finally:
+        connection.close()
+
+
+class GameProcess:
+    # One process per game: the WorkerWatchdog can kill a game without touching the others
+    def __init__(self, method, args):
+        self.connection, sender = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(target=_run_game, args=(sender, method, args), daemon=True)
+        self.process.start()
+        sender.close()
+        self.pid = self.process.pid
+        self.start_time = timeit.default_timer()
+
+    def get_result(self):
+        # None if the process died without sending a result (e.g. OOM killer, segfault): see died
+        try:
+            result = self.connection.recv()
+        except EOFError:
+            result = None
+        self.connection.close()
+        self.process.join()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    @property
+    def died(self):
+        # the process ended without a result: _run_game always sends one before exiting normally
+        return self.process.exitcode != 0
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class WorkerWatchdog:
+    # Finds the game processes running over the solver budget, or growing over
+    # MAX_WORKER_MEMORY_MB: Simulator.simulate kills them, and only them, and records
+    # their games as EXECUTION_BUDGET_EXCEEDED instead of playing other hands.
+    def __init__(self, max_runtime, max_memory_mb=MAX_WORKER_MEMORY_MB):
+        # the solver stops by itself at max_runtime: the grace covers returning the summary
+        self.max_runtime = max_runtime + WATCHDOG_GRACE_SECONDS
+        self.max_memory_mb = max_memory_mb
+        self.recycled = 0
+
+    def get_overrun(self, game_process):
+        # "runtime" or "memory" if the game must be killed, None otherwise
+        if timeit.default_timer() - game_process.start_time > self.max_runtime:
+            return "runtime"
+        if get_memory_usage_mb(game_process.pid) > self.max_memory_mb:
+            return "memory"
+        return None
 
 
 class Simulator:
-    def __init__(self, deck, num_sim, with_lucky_wins=True, initial_hand_size=None):
-        self.deck = deck
+    def __init__(self, deck, num_sim, with_lucky_wins=True, initial_hand_size=None, blind_spy_odds=False,
+                 results_path=RESULTS_PATH, profile=False, solution_cache=False, mcts=False, work_queue=None,
+                 seed=None):
+        self.deck_spec = get_deck_spec(deck)  # either a list of cards or a deck spec
         self.num_sim = num_sim
         self.summaries = []
-        self.simulation_name = get_deck_hash(self.deck)
+        self.simulation_name = get_deck_hash(self.deck_spec)
+        if blind_spy_odds:
+            # the solver drops lucky wins to record their odds instead (see Solver.solve):
+            # file names, solution cache and results database must say so
+            with_lucky_wins = False
         self.with_lucky_wins = with_lucky_wins
         self.initial_hand_size = initial_hand_size
-        self.deck_file = f"{RESULTS_PATH}{self.simulation_name}_deck.txt"
-        self.result_file = f"{RESULTS_PATH}{self.simulation_name}"
-        self.pkl_file = f"{RESULTS_PATH}{self.simulation_name}"
+        self.blind_spy_odds = blind_spy_odds
+        self.deck_file = f"{results_path}{self.simulation_name}_deck.txt"
+        self.result_file = f"{results_path}{self.simulation_name}"
+        self.pkl_file = f"{results_path}{self.simulation_name}"
         if not with_lucky_wins:
             self.result_file += "_no_lw"
             self.pkl_file += "_no_lw"
+        if blind_spy_odds:
+            self.result_file += "_bso"
+            self.pkl_file += "_bso"
+        # with mcts, each game gets the MCTSSolver budget instead of an exhaustive search
+        self.mcts = mcts
+        if mcts:
+            self.result_file += "_mcts"
+            self.pkl_file += "_mcts"
         if initial_hand_size:
             self.result_file += f"_hs{initial_hand_size}"
             self.pkl_file += f"_hs{initial_hand_size}"
+        # with solution_cache, solved states are saved, per deck and settings, for the next
+        # runs (see SolutionCache): random games almost never meet the same state, so it pays
+        # off when the same seeded games are played again
+        self.solution_cache = solution_cache
+        # with seed, game i is played with seed + i, whatever process runs it
+        self.seed = seed
+        self.games_started = 0
+        self.cache_file = f"{results_path}{self.simulation_name}{'' if with_lucky_wins else '_no_lw'}_cache.pkl"
+        # with profile, every game is cProfiled in its worker and merged in profile_stats
+        self.profile = profile
+        self.profile_stats = None
+        # with work_queue (a queue file), games are seeded tasks that workers on any host
+        # sharing the file can claim (see solver.work_queue)
+        self.work_queue = work_queue
+        self.profile_file = f"{self.result_file}.prof"
+        self.profile_report_file = f"{self.result_file}_profile.txt"
         self.result_file += ".txt"
         self.pkl_file += ".pkl"
 
-        os.makedirs(f"{RESULTS_PATH}", exist_ok=True)
+        os.makedirs(results_path, exist_ok=True)
 
     def simulate(self, load_existing=True):
         log.info(f"Simulations with initial hand size: {self.initial_hand_size}")
@@ -115,20 +269,57 @@ class Simulator:
             self.summaries = self.load(self.pkl_file)
             log.info(f"Loaded {len(self.summaries)} past simulations")
         log.info(50 * "-")
-        log.info(get_deck_diff(self.deck))
+        log.info(get_deck_diff(self.deck_spec))
         simulation_start_time = timeit.default_timer()
-        solver = ParallelSolver(self.deck)
+        if self.work_queue:
+            self._simulate_with_work_queue()
+            log.info(f"Overall simulation time: {timeit.default_timer() - simulation_start_time:.2f} s")
+            self.save()
+            return
+        solver = ParallelSolver(self.deck_spec)
+        method = getattr(solver, "run_profiled" if self.profile else "run")
+        # games restarted after a failure get new seeds: the loaded ones were played already
+        first_game = max(self.games_started, len(self.summaries))
         task_args = [
-            (solver, "run", (i, self.with_lucky_wins, self.initial_hand_size))
-            for i in range(self.num_sim - len(self.summaries))
+            (i, self.with_lucky_wins, self.initial_hand_size, self.blind_spy_odds, self.solution_cache, self.mcts,
+             None if self.seed is None else self.seed + i)
+            for i in range(first_game, first_game + self.num_sim - len(self.summaries))
         ]
-        with ProcessPoolExecutor(max_workers=EXECUTORS_NUM) as executor:
-            futures = {
-                executor.submit(run_instance_method, arg): arg
-                for arg in task_args
-            }
-            for future in as_completed(futures):
-                summary = future.result()
+        self.games_started = first_game + len(task_args)
+        if self.solution_cache:
+            # game processes are forked: they all start from the cache of this process
+            init_worker_solution_cache(self.cache_file)
+        max_runtime = MCTS_MAX_RUNTIME if self.mcts else core.MAX_SOLVER_RUNTIME
+        watchdog = WorkerWatchdog(max_runtime)
+        running = []
+        while task_args or running:
+            while task_args and len(running) < EXECUTORS_NUM:
+                running.append(GameProcess(method, task_args.pop(0)))
+            ready = wait([p.connection for p in running], timeout=WATCHDOG_POLL_SECONDS)
+            for game_process in list(running):
+                if game_process.connection in ready:
+                    summary = game_process.get_result()
+                    if game_process.died:
+                        log.warning(
+                            f"Game process {game_process.pid} died without a result "
+                            f"(exit code {game_process.process.exitcode})"
+                        )
+                        summary = self._get_lost_game_summary(game_process)
+                    elif self.profile:
+                        summary, stats = summary
+                        self._add_profile_stats(stats)
+                else:
+                    overrun = watchdog.get_overrun(game_process)
+                    if overrun is None:
+                        continue
+                    log.warning(f"Watchdog: game over {overrun} budget, killing its process ({game_process.pid})")
+                    game_process.kill()
+                    watchdog.recycled += 1
+                    summary = self._get_lost_game_summary(game_process)
+                running.remove(game_process)
+                if self.solution_cache:
+                    # the next games see what this one solved
+                    get_worker_solution_cache().load_shard(game_process.pid)
                 if summary:
                     self.summaries.append(summary)
                 if len(self.summaries) % CHECKPOINT_SIMULATIONS_EVERY_N == 0:
@@ -138,16 +329,71 @@ class Simulator:
         elapsed = timeit.default_timer() - simulation_start_time
         log.info(f"Overall simulation time: {elapsed:.2f} s")
         self.save()
+        if self.solution_cache:
+            SolutionCache.compact(self.cache_file)
+        if self.profile:
+            self.save_profile()
         if len(self.summaries) < self.num_sim:
             log.info("Some simulations are missing: restarting...")
             self.simulate()
 
+    @staticmethod
+    def _get_lost_game_summary(game_process):
+        # a game killed or dead before its result counts as kept and not won:
+        # playing another hand instead would bias the win rates
+        return SimulationSummary(
+            None, timeit.default_timer() - game_process.start_time, result=EXECUTION_BUDGET_EXCEEDED
+        )
+
+    def _simulate_with_work_queue(self):
+        # work_queue runs its games through ParallelSolver: imported here to avoid a cycle
+        from solitaire_spy.solver.work_queue import DONE, FAILED, WorkQueue, get_settings, run_workers
+
+        if self.solution_cache or self.profile:
+            log.warning("Solution cache and profiling are not supported with a work queue: ignoring them")
+        settings = get_settings(self.with_lucky_wins, self.initial_hand_size, self.blind_spy_odds, self.mcts)
+        queue = WorkQueue(self.work_queue)
+        try:
+            deck_hash = queue.submit(self.deck_spec, self.num_sim, settings)
+            while True:
+                run_workers(self.work_queue)
+                progress = queue.get_progress(deck_hash, settings)
+                log.info(f"Work queue tasks: {progress}")
+                if sum(progress.values()) == progress.get(DONE, 0) + progress.get(FAILED, 0):
+                    break
+                # the other tasks are leased by workers on other hosts: wait for them or their leases
+                time.sleep(WATCHDOG_POLL_SECONDS)
+            if progress.get(FAILED, 0):
+                log.warning(
+                    f"Work queue: {progress[FAILED]} tasks failed after {WORK_QUEUE_MAX_ATTEMPTS} leases: "
+                    f"their games are missing from the results"
+                )
+            self.summaries = [s for s in queue.get_summaries(deck_hash, settings, self.num_sim) if s]
+        finally:
+            queue.close()
+
+    def _add_profile_stats(self, stats):
+        if self.profile_stats is None:
+            self.profile_stats = pstats.Stats(WorkerProfile(stats))
+        else:
+            self.profile_stats.add(WorkerProfile(stats))
+
+    def save_profile(self, top_n=PROFILE_TOP_N):
+        if self.profile_stats is None:
+            return
+        self.profile_stats.dump_stats(self.profile_file)
+        with open(self.profile_report_file, "w") as f:
+            report = pstats.Stats(self.profile_file, stream=f)
+            f.write(f"Profile of {len(self.summaries)} simulations (merged over all workers)\n")
+            report.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top_n)
+            report.sort_stats(pstats.SortKey.TIME).print_stats(top_n)
+        log.info(f"Profile saved into {self.profile_file} and {self.profile_report_file}")
+
     def _save_deck_if_needed(self):
         if not os.path.exists(self.deck_file):
-            deck_counter = dict(Counter(c.name for c in self.deck))
             with open(self.deck_file, "w") as f:
-                for k in sorted(deck_counter.keys()):
-                    f.write(f"{deck_counter[k]} {k}\n")
+                for k in sorted(self.deck_spec.keys()):
+                    f.write(f"{self.deck_spec[k]} {k}\n")
 
     def _get_games_won_by_turn(
             self,
@@ -216,11 +462,11 @@ class Simulator:
     def log_stats(self):
         self._save_deck_if_needed()
 
-        result_lines = [get_deck_diff(self.deck), ""]
+        result_lines = [get_deck_diff(self.deck_spec), ""]
         mulliganed_simulations, terminated_simulations, not_terminated_simulations = self._get_summaries_by_type(self.summaries)
         kept_simulations = terminated_simulations + not_terminated_simulations
 
-        max_turn = max(s.counter_turn for s in terminated_simulations)
+        max_turn = max((s.counter_turn for s in terminated_simulations), default=MIN_TURN_WIN_POSSIBLE)
         interested_in_turn_up_to = min(
             max_turn, MAX_TURN
         )  # set 'max_turn + 1' to see all turns
@@ -258,13 +504,8 @@ class Simulator:
         log.info("")
         result_lines.append("")
         mana_t1 = defaultdict(int)  # mana_amount : occurrences
-        mana_cards = [MTGLand, LotusPetal, TrollOfKhazadDum, GenerousEnt, LandGrant, SaguWildling]
         for summary in kept_simulations:
-            initial_mana = sum(
-                1 for c in summary.initial_hand
-                if any(isinstance(c, i) for i in mana_cards)
-            )
-            mana_t1[initial_mana] += 1
+            mana_t1[get_t1_mana(summary.initial_hand)] += 1
         mana_t1_by = {}
         for i in range(1, INITIAL_HAND_SIZE + 1):
             line = (
@@ -346,8 +587,61 @@ class Simulator:
                 log.info(line)
                 result_lines.append(line)
 
+        if self.blind_spy_odds:
+            log.info("")
+            result_lines.append("")
+            # a game won scientifically does not need the blind Spy.
+            # Odds are a lower bound (see SimulationSummary.blind_spy_odds)
+            blind_spy_simulations = [
+                s for s in self.summaries
+                if s.opponent_counter_life > 0 and getattr(s, "blind_spy_odds", 0) > 0
+            ]
+            expected_blind_spy_wins = sum(s.blind_spy_odds for s in blind_spy_simulations)
+            line = (
+                f"Lucky wins (blind Spy odds): "
+                f"{expected_blind_spy_wins:.2f} "
+                f"({expected_blind_spy_wins / len(self.summaries) * 100:.2f}%)"
+            )
+            log.info(line)
+            result_lines.append(line)
+            for i in range(MIN_TURN_WIN_POSSIBLE, MAX_TURN):
+                expected_blind_spy_wins_on_turn_i = sum(
+                    s.blind_spy_odds for s in blind_spy_simulations if s.blind_spy_turn == i
+                )
+                if expected_blind_spy_wins_on_turn_i > 0:
+                    line = (
+                        f" L on turn {i}: "
+                        f"{expected_blind_spy_wins_on_turn_i:.2f} "
+                        f"({expected_blind_spy_wins_on_turn_i / len(self.summaries) * 100:.2f}%)"
+                    )
+                    log.info(line)
+                    result_lines.append(line)
+
+        if self.mcts:
+            log.info("")
+            result_lines.append("")
+            won_simulations = [s for s in terminated_simulations if s.kept_at > 0]
+            line = (
+                f"Average MCTS confidence on wins: "
+                f"{sum(s.confidence for s in won_simulations) / max(1, len(won_simulations)):.4f}"
+            )
+            log.info(line)
+            result_lines.append(line)
+
         log.info("")
         result_lines.append("")
+        # runtime budget (EXECUTION_TIMEOUT), node or memory budget, watchdog kills and dead game processes
+        over_budget = sum(
+            1 for s in self.summaries
+            if getattr(s, "result", None) in (EXECUTION_TIMEOUT, EXECUTION_BUDGET_EXCEEDED)
+        )
+        line = (
+            f"Games over budget (not won): "
+            f"{over_budget} "
+            f"({over_budget / len(self.summaries) * 100:.2f}%)"
+        )
+        log.info(line)
+        result_lines.append(line)
         line = (
             f"Average solving time: "
             f"{sum(s.solving_time for s in kept_simulations) / len(kept_simulations):.2f} s"
@@ -417,6 +711,12 @@ class Simulator:
                 f.write(line)
                 f.write("\n")
 
+    def __getstate__(self):
+        # merged profiles go to their own files, not to the pickle
+        state = self.__dict__.copy()
+        state["profile_stats"] = None
+        return state
+
     def save(self):
         log.debug(f"Saving simulator results to {self.pkl_file}")
         with open(self.pkl_file, "wb") as f:
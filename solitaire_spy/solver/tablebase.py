@@ -0,0 +1,112 @@
+import itertools
+import logging
+
+from solitaire_spy.cards.creatures import BalustradeSpy, LotlethGiant, EldraziSpawn
+from solitaire_spy.cards.mtg_cards import MTGCreatureSpell
+from solitaire_spy.cards.spells import DreadReturn
+from solitaire_spy.log import get_logger
+
+log = get_logger(__name__, stdout_level=logging.WARNING)
+
+# Endgame tablebase: once Spy and Giant are in the graveyard, whether Lotleth Giant
+# can be reanimated for lethal only depends on an abstract combo position.
+# Creatures in the graveyard and opponent life are not part of the key: every move
+# adds a fixed bonus to the creatures in the graveyard, so a position is won iff
+# creatures in the graveyard + bonus >= opponent life.
+FLASHBACK = "flashback"
+CAST = "cast"
+
+DREAD_RETURN_COST = DreadReturn().mana_cost_map
+DREAD_RETURN_BLACK = DREAD_RETURN_COST['B']
+DREAD_RETURN_TOTAL = sum(DREAD_RETURN_COST.values())
+MAX_CREATURES_TO_SACRIFICE = 3
+
+
+def get_combo_key(graveyard, hand, battlefield, mana_pool):
+    # (creatures on the battlefield, creatures that would not be exiled if sacrificed,
+    #  DR in hand, DR in graveyard, Giant in graveyard, Spy in graveyard, B mana, total mana),
+    # with counts clamped to what the moves can use
+    creatures = [c for c in battlefield if isinstance(c, MTGCreatureSpell)]
+    return (
+        min(MAX_CREATURES_TO_SACRIFICE, len(creatures)),
+        # tokens are exiled when sacrificed, so they do not grow the graveyard
+        min(MAX_CREATURES_TO_SACRIFICE, sum(not isinstance(c, EldraziSpawn) for c in creatures)),
+        any(isinstance(c, DreadReturn) for c in hand),
+        any(isinstance(c, DreadReturn) for c in graveyard),
+        any(isinstance(c, LotlethGiant) for c in graveyard),
+        any(isinstance(c, BalustradeSpy) for c in graveyard),
+        max(0, min(DREAD_RETURN_BLACK, mana_pool['B'])),
+        max(0, min(DREAD_RETURN_TOTAL, sum(mana_pool.values()))),
+    )
+
+
+def _solve_position(creatures, creatures_to_sacrifice, dread_return_in_hand, dread_return_in_graveyard,
+                    giant_in_graveyard, spy_in_graveyard, black_mana, total_mana):
+    # best (bonus, move) reanimating Lotleth Giant, or None if the Giant cannot come back
+    # Dread Return is only enabled once both Spy and Giant are in the graveyard
+    if not (giant_in_graveyard and spy_in_graveyard):
+        return None
+    moves = []
+    if dread_return_in_graveyard and creatures >= MAX_CREATURES_TO_SACRIFICE:
+        # -1 Giant itself + creatures sacrificed to flashback Dread Return
+        moves.append((creatures_to_sacrifice - 1, FLASHBACK))
+    if dread_return_in_hand and black_mana >= DREAD_RETURN_BLACK and total_mana >= DREAD_RETURN_TOTAL:
+        moves.append((-1, CAST))  # -1 Giant itself
+    # on ties flashback comes first: it keeps Dread Return in hand
+    return max(moves, key=lambda m: m[0]) if moves else None
+
+
+def _build_tablebase():
+    tablebase = {}
+    for creatures in range(MAX_CREATURES_TO_SACRIFICE + 1):
+        for creatures_to_sacrifice in range(creatures + 1):
+            for flags in itertools.product((False, True), repeat=4):
+                for black_mana in range(DREAD_RETURN_BLACK + 1):
+                    for total_mana in range(DREAD_RETURN_TOTAL + 1):
+                        key = (creatures, creatures_to_sacrifice, *flags, black_mana, total_mana)
+                        tablebase[key] = _solve_position(*key)
+    return tablebase
+
+
+TABLEBASE = _build_tablebase()
+
+
+def lookup(key, creatures_in_graveyard, opponent_life):
+    # returns (Giant damage, move) if the position is won, (best Giant damage, None) otherwise
+    solution = TABLEBASE[key]
+    if solution is None:
+        return 0, None
+    bonus, move = solution
+    damage = creatures_in_graveyard + bonus
+    return damage, (move if damage >= opponent_life else None)
+
+
+def get_finisher(env, move):
+    # the Dread Return action playing move on env
+    giant_index = next(
+        i for i, c in enumerate(env.graveyard) if isinstance(c, LotlethGiant)
+    )
+    if move == FLASHBACK:
+        dread_return = next(c for c in env.graveyard if isinstance(c, DreadReturn))
+        creatures = [
+            i for i, c in enumerate(env.battlefield)
+            if isinstance(c, MTGCreatureSpell)
+        ]
+        # sacrifice tokens only if there are not enough cards
+        creatures.sort(key=lambda i: isinstance(env.battlefield[i], EldraziSpawn))
+        triple = sorted(creatures[:MAX_CREATURES_TO_SACRIFICE])
+        return dread_return, f"flashback_with_target@{giant_index},{'-'.join(str(i) for i in triple)}"
+    dread_return = next(c for c in env.hand if isinstance(c, DreadReturn))
+    return dread_return, f"cast_with_target@{giant_index}"
+
+
+def get_winning_action(env):
+    # tablebase move for env, if env is a won combo position: (None, None) otherwise
+    if not any(isinstance(c, LotlethGiant) for c in env.graveyard):
+        return None, None
+    key = get_combo_key(env.graveyard, env.hand, env.battlefield, env.mana_pool)
+    creatures_in_graveyard = sum(isinstance(c, MTGCreatureSpell) for c in env.graveyard)
+    _, move = lookup(key, creatures_in_graveyard, env.opponent_counter_life)
+    if move is None:
+        return None, None
+    return get_finisher(env, move)
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from solitaire_spy.constants import *
+from solitaire_spy.deck import get_deck_hash, get_deck_spec
+from solitaire_spy.log import get_logger
+from solitaire_spy.solver.simulator import ParallelSolver
+
+log = get_logger(__name__, log_format="%(message)s", stdout_level=logging.INFO)
+
+# Work queue shared by any number of workers, on any host that mounts the queue file.
+# A task is a range of seeds to simulate for a deck and some Simulator settings.
+# Workers lease tasks: a heartbeat renews the lease while the games of a task run, and a
+# lease left to expire (e.g. by a dead worker) lets another worker claim the task again.
+# Leases use wall-clock time: hosts need synchronized clocks, and the file system must
+# support SQLite locking (local disks do; some network file systems do not).
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"  # leased WORK_QUEUE_MAX_ATTEMPTS times without being completed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decks (
+    deck_hash TEXT PRIMARY KEY,
+    deck_spec TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deck_hash TEXT NOT NULL REFERENCES decks(deck_hash),
+    settings TEXT NOT NULL,
+    seed_start INTEGER NOT NULL,
+    seed_end INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (deck_hash, settings, seed_start)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+CREATE TABLE IF NOT EXISTS results (
+    task_id INTEGER NOT NULL REFERENCES tasks(id),
+    seed INTEGER NOT NULL,
+    summary BLOB,
+    PRIMARY KEY (task_id, seed)
+);
+"""
+
+
+def get_settings(with_lucky_wins, initial_hand_size, blind_spy_odds=False, mcts=False):
+    # ParallelSolver.run keyword arguments, as a canonical string
+    return json.dumps({
+        "with_lucky_wins": with_lucky_wins,
+        "initial_hand_size": initial_hand_size,
+        "blind_spy_odds": blind_spy_odds,
+        "mcts": mcts,
+    }, sort_keys=True)
+
+
+def get_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Task:
+    def __init__(self, task_id, deck_spec, settings, seed_start, seed_end):
+        self.task_id = task_id
+        self.deck_spec = deck_spec
+        self.settings = settings
+        self.seed_start = seed_start
+        self.seed_end = seed_end
+
+    def __str__(self):
+        return f"task #{self.task_id} (seeds {self.seed_start}-{self.seed_end - 1})"
+
+
+class WorkQueue:
+    def __init__(self, queue_file=WORK_QUEUE_PATH):
+        self.queue_file = queue_file
+        os.makedirs(os.path.dirname(queue_file) or ".", exist_ok=True)
+        # transactions are explicit: claims need BEGIN IMMEDIATE to lock out other workers
+        self.connection = sqlite3.connect(queue_file, timeout=60, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def submit(self, deck, num_sim, settings, seeds_per_task=WORK_QUEUE_SEEDS_PER_TASK):
+        # Seeds 0..num_sim-1, in tasks of seeds_per_task: every deck plays the same seeds.
+        # Seeds already submitted are left as they are. Returns the deck hash.
+        deck_spec = get_deck_spec(deck)
+        deck_hash = get_deck_hash(deck_spec)
+        connection = self._transaction()
+        try:
+            connection.execute(
+                "INSERT OR IGNORE INTO decks (deck_hash, deck_spec) VALUES (?, ?)",
+                (deck_hash, json.dumps(dict(deck_spec), sort_keys=True)),
+            )
+            submitted, = connection.execute(
+                "SELECT COALESCE(MAX(seed_end), 0) FROM tasks WHERE deck_hash = ? AND settings = ?",
+                (deck_hash, settings),
+            ).fetchone()
+            connection.executemany(
+                "INSERT INTO tasks (deck_hash, settings, seed_start, seed_end) VALUES (?, ?, ?, ?)",
+                [(deck_hash, settings, seed, min(seed + seeds_per_task, num_sim))
+                 for seed in range(submitted, num_sim, seeds_per_task)],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return deck_hash
+
+    def claim(self, worker_id, lease_seconds=WORK_QUEUE_LEASE_SECONDS):
+        # the first pending task, or an abandoned one: None if there is nothing to do
+        now = time.time()
+        connection = self._transaction()
+        try:
+            # abandoned tasks leased too many times are given up
+            connection.execute(
+                "UPDATE tasks SET status = ?, worker = NULL "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, LEASED, now, WORK_QUEUE_MAX_ATTEMPTS),
+            )
+            row = connection.execute(
+                "SELECT t.id, d.deck_spec, t.settings, t.seed_start, t.seed_end "
+                "FROM tasks t JOIN decks d ON t.deck_hash = d.deck_hash "
+                "WHERE t.status = ? OR (t.status = ? AND t.lease_expires < ?) "
+                "ORDER BY t.id LIMIT 1",
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            task_id, deck_spec, settings, seed_start, seed_end = row
+            connection.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (LEASED, worker_id, now + lease_seconds, task_id),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return Task(task_id, Counter(json.loads(deck_spec)), json.loads(settings), seed_start, seed_end)
+
+    def renew(self, task, worker_id, lease_seconds=WORK_QUEUE_LEASE_SECONDS):
+        # returns False if the lease has been lost to another worker
+        cursor = self.connection.execute(
+            "UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?",
+            (time.time() + lease_seconds, task.task_id, worker_id, LEASED),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, task, worker_id, summaries):
+        # summaries: {seed: SimulationSummary or None}. Returns False if the lease was lost
+        connection = self._transaction()
+        try:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = ?, lease_expires = NULL WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, task.task_id, worker_id, LEASED),
+            )
+            if cursor.rowcount != 1:
+                connection.execute("ROLLBACK")
+                return False
+            connection.executemany(
+                "INSERT OR REPLACE INTO results (task_id, seed, summary) VALUES (?, ?, ?)",
+                [(task.task_id, seed, pickle.dumps(summary)) for seed, summary in summaries.items()],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return True
+
+    def get_progress(self, deck_hash=None, settings=None):
+        # {status: number of tasks}, for a deck and settings or for the whole queue
+        query = "SELECT status, COUNT(*) FROM tasks"
+        args = ()
+        if deck_hash is not None:
+            query += " WHERE deck_hash = ? AND settings = ?"
+            args = (deck_hash, settings)
+        return dict(self.connection.execute(query + " GROUP BY status", args).fetchall())
+
+    def get_summaries(self, deck_hash, settings, num_sim):
+        # the summaries of the completed seeds below num_sim, by seed
+        # (None for games that returned no summary)
+        rows = self.connection.execute(
+            "SELECT r.summary FROM results r JOIN tasks t ON r.task_id = t.id "
+            "WHERE t.deck_hash = ? AND t.settings = ? AND t.status = ? AND r.seed < ? ORDER BY r.seed",
+            (deck_hash, settings, DONE, num_sim),
+        ).fetchall()
+        return [pickle.loads(summary) for summary, in rows]
+
+
+class LeaseHeartbeat(threading.Thread):
+    # Renews the lease of a task every interval while its games run, so that a long game
+    # does not let it expire. It has its own connection: SQLite connections stay in their thread.
+    def __init__(self, queue_file, task, worker_id, interval=WORK_QUEUE_HEARTBEAT_SECONDS,
+                 lease_seconds=WORK_QUEUE_LEASE_SECONDS):
+        super().__init__(daemon=True)
+        self.queue_file = queue_file
+        self.task = task
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.lost = threading.Event()  # the lease went to another worker
+
+    def run(self):
+        queue = WorkQueue(self.queue_file)
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not queue.renew(self.task, self.worker_id, self.lease_seconds):
+                        self.lost.set()
+                        return
+                except sqlite3.Error as e:
+                    log.warning(f"Lease renewal of {self.task} failed, retrying: {e}")
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_task(task, queue, worker_id):
+    solver = ParallelSolver(task.deck_spec)
+    summaries = {}
+    heartbeat = LeaseHeartbeat(queue.queue_file, task, worker_id)
+    heartbeat.start()
+    try:
+        for seed in range(task.seed_start, task.seed_end):
+            summaries[seed] = solver.run(seed, seed=seed, **task.settings)
+            if heartbeat.lost.is_set():
+                log.warning(f"Lease lost on {task}: dropping it")
+                return False
+    finally:
+        heartbeat.stop()
+    return queue.complete(task, worker_id, summaries)
+
+
+def run_worker(queue_file=WORK_QUEUE_PATH, max_tasks=None):
+    # claims and runs tasks until the queue has nothing left to claim
+    queue = WorkQueue(queue_file)
+    worker_id = get_worker_id()
+    tasks_done = 0
+    try:
+        while max_tasks is None or tasks_done < max_tasks:
+            task = queue.claim(worker_id)
+            if task is None:
+                break
+            log.info(f"Worker {worker_id}: running {task}")
+            if run_task(task, queue, worker_id):
+                tasks_done += 1
+    finally:
+        queue.close()
+    return tasks_done
+
+
+def run_workers(queue_file=WORK_QUEUE_PATH, num_workers=EXECUTORS_NUM):
+    # one worker per process on this host: run it on every host that mounts the queue
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(run_worker, queue_file) for _ in range(num_workers)]
+        return sum(f.result() for f in futures)
+
+
+if __name__ == '__main__':
+    run_workers(sys.argv[1] if len(sys.argv) > 1 else WORK_QUEUE_PATH)
@@ -0,0 +1,67 @@
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+from solitaire_spy.constants import *
+from solitaire_spy.log import get_logger
+from solitaire_spy.solver.work_queue import DONE, LeaseHeartbeat, WorkQueue, get_settings
+
+log = get_logger(__name__, log_format="%(message)s", stdout_level=logging.INFO)
+
+# Timings are loose so that the check holds on a loaded host: a lease is only checked
+# well before or well after it expires, and a heartbeat gets many beats per lease.
+CHECK_LEASE_SECONDS = 2
+CHECK_HEARTBEAT_SECONDS = 0.25
+CHECK_HEARTBEAT_LEASES = 3  # lease durations a heartbeat has to keep a lease alive for
+
+
+class LeaseCheckError(Exception):
+    pass
+
+
+def check(condition, message):
+    # explicit, unlike assert, so that the check also runs under python -O
+    if not condition:
+        raise LeaseCheckError(message)
+
+
+def check_lease_reclaim():
+    # a task abandoned by a worker is claimed again once its lease expires,
+    # and the first worker can no longer renew or complete it: on a temporary queue file
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = WorkQueue(os.path.join(tmp_dir, "work_queue.sqlite"))
+        try:
+            settings = get_settings(with_lucky_wins=False, initial_hand_size=7)
+            queue.submit(Counter({"Forest": DECK_SIZE}), 2, settings, seeds_per_task=2)
+            task = queue.claim("abandoning worker", lease_seconds=CHECK_LEASE_SECONDS)
+            check(task is not None, "the submitted task was not claimed")
+            check(queue.claim("second worker") is None, "a leased task was claimed")
+            time.sleep(1.5 * CHECK_LEASE_SECONDS)
+            reclaimed = queue.claim("second worker", lease_seconds=CHECK_LEASE_SECONDS)
+            check(reclaimed is not None and reclaimed.task_id == task.task_id, "the abandoned task was not reclaimed")
+            check(not queue.renew(task, "abandoning worker"), "a lost lease was renewed")
+            check(not queue.complete(task, "abandoning worker", {}), "a lost lease was completed")
+
+            # a heartbeat keeps a lease alive well past its duration
+            heartbeat = LeaseHeartbeat(queue.queue_file, reclaimed, "second worker",
+                                       interval=CHECK_HEARTBEAT_SECONDS, lease_seconds=CHECK_LEASE_SECONDS)
+            heartbeat.start()
+            try:
+                time.sleep(CHECK_HEARTBEAT_LEASES * CHECK_LEASE_SECONDS)
+                check(queue.claim("third worker") is None, "a lease renewed by a heartbeat was claimed")
+            finally:
+                heartbeat.stop()
+            check(not heartbeat.lost.is_set(), "the heartbeat lost its lease")
+
+            check(queue.complete(reclaimed, "second worker", {0: None, 1: None}), "the reclaimed task was not completed")
+            check(queue.get_progress() == {DONE: 1}, f"unexpected queue progress: {queue.get_progress()}")
+        finally:
+            queue.close()
+    log.info("Lease reclaim check passed")
+
+
+if __name__ == '__main__':
+    # python -m solitaire_spy.solver.work_queue_check
+    check_lease_reclaim()
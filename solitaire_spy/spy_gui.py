@@ -1,21 +1,51 @@
 # auto-generated by ChatGPT
 
+import queue
 import tkinter as tk
+from functools import lru_cache
 from tkinter import ttk
 from PIL import Image, ImageTk
 
-from solitaire_spy.cards.mtg_cards import MTGCard
-from solitaire_spy.constants import CARD_IMAGES_PATH
+from solitaire_spy.constants import CARD_IMAGES_PATH, GUI_FRAME_INTERVAL_MS, MANA_TYPES
+
+ZONES = ["Battlefield", "Lands", "Hand", "Graveyard", "Exile"]
+MANA_POOL = "Mana pool"
+
+
+@lru_cache(maxsize=None)
+def get_thumbnail(image_name, angle, thumb_size):
+    # Pre-scaled once per card name, orientation and size, then shared by all the tiles.
+    # Rotate from the original to avoid repeated-quality loss
+    pil_img = Image.open(f"{CARD_IMAGES_PATH}/{image_name}.jpg").convert("RGBA")
+    rotated = pil_img.rotate(-angle, expand=True)
+    # Create a thumbnail that fits within thumb_size while preserving aspect ratio
+    w, h = rotated.size
+    max_w, max_h = thumb_size
+    ratio = min(max_w / w, max_h / h)
+    new_size = (max(1, int(w * ratio)), max(1, int(h * ratio)))
+    return rotated.resize(new_size, Image.LANCZOS)
+
+
+_photo_images = {}  # (image name, angle, thumb size): ImageTk.PhotoImage, for the Tk root
+
+
+def get_photo_image(image_name, angle, thumb_size):
+    key = (image_name, angle, thumb_size)
+    if key not in _photo_images:
+        _photo_images[key] = ImageTk.PhotoImage(get_thumbnail(image_name, angle, thumb_size))
+    return _photo_images[key]
 
 
 class PictureTile:
-    def __init__(self, parent, pil_image, label_text, card, on_update=None, thumb_size=(200, 600)):
+    def __init__(self, parent, image_name, label_text, card, on_update=None, thumb_size=(200, 600)):
         self.parent = parent
         self.card = card
-        self.pil_original = pil_image.convert("RGBA")
+        self.image_name = image_name
         self.angle = 0
         self.on_update = on_update
         self.thumb_size = thumb_size
+        self.label = label_text
+        self.position = None  # (row, column), None if not gridded
 
         # Create UI
         self.frame = ttk.Frame(parent, relief="flat", padding=4)
@@ -28,47 +58,38 @@ class PictureTile:
         # Display initial image
         self._update_image()
 
-    def _make_thumbnail(self, pil_img):
-        # Create a thumbnail that fits within thumb_size while preserving aspect ratio
-        w, h = pil_img.size
-        max_w, max_h = self.thumb_size
-        ratio = min(max_w / w, max_h / h)
-        new_size = (max(1, int(w * ratio)), max(1, int(h * ratio)))
-        thumb = pil_img.resize(new_size, Image.LANCZOS)
-        return thumb
-
     def _update_image(self):
-        # Rotate from the original to avoid repeated-quality loss
-        rotated = self.pil_original.rotate(-self.angle, expand=True)
-        thumb = self._make_thumbnail(rotated)
-
-        # Convert to ImageTk
-        self.tk_image = ImageTk.PhotoImage(thumb)
+        self.tk_image = get_photo_image(self.image_name, self.angle, self.thumb_size)
         self.canvas.configure(image=self.tk_image)
 
         if callable(self.on_update):
             self.on_update(self)
 
-    def rotate(self):
-        if self.card.is_tapped:
-            self.angle = 90
-        else:
-            self.angle = 0
-        self._update_image()
+    def rotate(self, angle):
+        if angle != self.angle:
+            self.angle = angle
+            self._update_image()
 
     def set_label(self, label):
-        self.text_label.configure(text=label)
-        self.text_label.pack(fill="x", pady=(6, 0))
+        if label != self.label:
+            self.label = label
+            self.text_label.configure(text=label)
 
     def grid(self, row, column):
-        self.frame.grid(row=row, column=column, padx=6, pady=6, sticky="n")
+        if self.position != (row, column):
+            self.position = (row, column)
+            self.frame.grid(row=row, column=column, padx=6, pady=6, sticky="n")
+
+    def grid_forget(self):
+        if self.position is not None:
+            self.position = None
+            self.frame.grid_forget()
 
 
 class ImageGridApp:
-    def __init__(self, root, title, cards, columns=4):
+    def __init__(self, root, title, columns=4):
         self.root = root
         self.columns = columns
-        self.cards = cards
 
         self.toolbar = ttk.Frame(root, padding=6)
         self.toolbar.pack(fill="x")
@@ -95,47 +116,104 @@ class ImageGridApp:
 
         self.tiles = {}
         self.tile_cache = {}
-        self.load_images()
-
-    def load_images(self, env=None):
-        # Hide existing tiles
-        for t in self.tiles.values():
-            t.frame.grid_forget()
-        self.tiles = {}
 
-        for card in self.cards:
+    def show(self, entries):
+        # entries: (card or mana symbol, angle, label), see get_frame.
+        # Only the tiles that left the zone, moved or changed are touched
+        tiles = {}
+        for card, _, _ in entries:
             if card not in self.tile_cache:
-                card_path = f"{CARD_IMAGES_PATH}/{card}.jpg"
-                pil = Image.open(card_path)
                 label = ""
-                tile = PictureTile(self.grid_frame, pil, label, card, thumb_size=(220, 160))
+                tile = PictureTile(self.grid_frame, str(card), label, card, thumb_size=(220, 160))
                 self.tile_cache[card] = tile
-            self.tiles[card] = self.tile_cache[card]
+            tiles[card] = self.tile_cache[card]
+        for card, tile in self.tiles.items():
+            if card not in tiles:
+                tile.grid_forget()
+        self.tiles = tiles
 
-        self.redraw(env)
-
-    def redraw(self, env=None):
-        # Recreate grid layout
         cols = self.columns
-
-        for i, tile_key in enumerate(self.tiles.keys()):
+        layout_changed = False
+        for i, (card, angle, label) in enumerate(entries):
             row = i // cols
             col = i % cols
-            tile = self.tiles[tile_key]
+            tile = self.tiles[card]
+            layout_changed |= tile.position != (row, col)
             tile.grid(row, col)
-            label = ""
-            if hasattr(tile_key, "ability_once_per_turn_activated") and tile_key.ability_once_per_turn_activated:
-                label += "[A] "
-            if hasattr(tile_key, "minus_counters") and tile_key.minus_counters > 0:
-                label += f"{tile_key.minus_counters}x -0/-1 counters"
+            tile.rotate(angle)
             tile.set_label(label)
 
-            if isinstance(tile_key, MTGCard):
-                tile.rotate()
-            else:  # i.e. if it's a mana symbol
-                if env and env.mana_pool:
-                    tile.set_label(10 * " " + str(env.mana_pool[tile_key]))
-
-        # update canvas scrollregion
-        self.root.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        if layout_changed:
+            # update canvas scrollregion
+            self.root.update_idletasks()
+            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+
+
+def get_zone_entries(cards):
+    entries = []
+    for card in cards:
+        label = ""
+        if hasattr(card, "ability_once_per_turn_activated") and card.ability_once_per_turn_activated:
+            label += "[A] "
+        if hasattr(card, "minus_counters") and card.minus_counters > 0:
+            label += f"{card.minus_counters}x -0/-1 counters"
+        entries.append((card, 90 if card.is_tapped else 0, label))
+    return entries
+
+
+def get_frame(env):
+    # Snapshot of what the GUI shows, taken by the game thread: the Tk main loop
+    # draws it later, without reading the env while the game goes on
+    side = "opponent" if env.engine.passing else "mine"
+    return {
+        "title": (
+            f"MTGO at home | "
+            f"Turn {env.counter_turn} ({side}) | "
+            f"Life {env.counter_life} vs {env.opponent_counter_life}"
+        ),
+        "Battlefield": get_zone_entries(env.battlefield),
+        "Lands": get_zone_entries(env.lands),
+        "Hand": get_zone_entries(env.hand),
+        "Graveyard": get_zone_entries(env.graveyard),
+        "Exile": get_zone_entries(env.exile),
+        MANA_POOL: [(m, 0, 10 * " " + str(env.mana_pool[m])) for m in MANA_TYPES],
+    }
+
+
+class SolitaireGui:
+    # The game thread publishes frames into a queue and the Tk main loop shows them
+    # on an after() timer: Tk widgets are only touched by the main thread.
+    # With coalesce, every tick shows the latest frame and drops the older ones (live play);
+    # without it, every frame is shown for frame_interval_ms (replays at a given speed).
+    def __init__(self, root, frame_interval_ms=GUI_FRAME_INTERVAL_MS, coalesce=True):
+        self.root = root
+        self.frame_interval_ms = frame_interval_ms
+        self.coalesce = coalesce
+        self.frames = queue.Queue()
+        self.frames_shown = 0
+        self.frames_dropped = 0
+        self.grids = {zone: ImageGridApp(root, zone, columns=10) for zone in ZONES}
+        self.grids[MANA_POOL] = ImageGridApp(root, MANA_POOL, columns=len(MANA_TYPES))
+        self.root.after(self.frame_interval_ms, self._poll)
+
+    def publish(self, env):
+        self.frames.put(get_frame(env))
+
+    def _poll(self):
+        frame = None
+        try:
+            frame = self.frames.get_nowait()
+            while self.coalesce:
+                frame = self.frames.get_nowait()
+                self.frames_dropped += 1
+        except queue.Empty:
+            pass
+        if frame is not None:
+            self._show(frame)
+        self.root.after(self.frame_interval_ms, self._poll)
+
+    def _show(self, frame):
+        self.root.title(frame["title"])
+        for zone, grid in self.grids.items():
+            grid.show(frame[zone])
+        self.frames_shown += 1
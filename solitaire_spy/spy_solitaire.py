@@ -1,23 +1,26 @@
 import logging
-import random
 
 from solitaire_spy.cards.mtg_cards import MTGLand
 from solitaire_spy.constants import *
 from solitaire_spy.log import get_logger
 from solitaire_spy.mtg_engine import MtgEngine
-from solitaire_spy.spy_gui import ImageGridApp
+from solitaire_spy.trace import tracer
 
 log = get_logger(__name__, stdout_level=logging.WARNING)
 
 
 class MTGSolitaire:
-    def __init__(self, deck, tk_root):
+    def __init__(self, deck, tk_root, scripted_shuffles=None, replay_speed=None):
+        # scripted_shuffles (a shuffle_log) and replay_speed (ms per step) replay a game
         log.debug("*** init ***")
         self.engine = MtgEngine(self)
         self.library = deck
         self.lands_in_deck = sum(isinstance(c, MTGLand) for c in deck)
+        self.shuffle_log = []  # card names in the library after each shuffle
+        self.scripted_shuffles = list(scripted_shuffles or [])
+        self.shuffle_seed = None  # if set, shuffles do not draw from the global RNG (see MCTSSolver)
         while True:
-            random.shuffle(self.library)
+            self.engine.shuffle_library()
             # uncomment below to force certain starting hands
             # if any(c for c in self.library[0:7] if c.name == "Dimir House Guard") and any(c for c in self.library[0:7] if c.name == "Swamp"):
             #    break
@@ -41,39 +44,32 @@ class MTGSolitaire:
         self.interaction_count = 0
         self.unknown_lands_in_deck_on_combo = self.lands_in_deck
         self.mulled_bottom = []
+        self.cache_keys = []  # (solution cache key, steps played, shuffles played) of the solved states on this line
 
         self.tk_root = tk_root
-        self.gui_battlefield = None
-        self.gui_lands = None
-        self.gui_hand = None
-        self.gui_graveyard = None
-        self.gui_exile = None
-        self.gui_mana_pool = None
+        self.gui = None
 
         if tk_root:
-            self.gui_battlefield = ImageGridApp(
-                self.tk_root, "Battlefield", self.battlefield, columns=10
-            )
-            self.gui_lands = ImageGridApp(
-                self.tk_root, "Lands", self.lands, columns=10
-            )
-            self.gui_hand = ImageGridApp(
-                self.tk_root, "Hand", self.hand, columns=10
-            )
-            self.gui_graveyard = ImageGridApp(
-                self.tk_root, "Graveyard", self.graveyard, columns=10
-            )
-            self.gui_exile = ImageGridApp(
-                self.tk_root, "Exile", self.exile, columns=10
-            )
-            self.gui_mana_pool = ImageGridApp(
-                self.tk_root, "Mana pool", self.mana_pool, columns=len(self.mana_pool)
-            )
+            # imported here so that headless runs never load tkinter or Pillow
+            from solitaire_spy.spy_gui import SolitaireGui
+
+            if replay_speed:
+                self.gui = SolitaireGui(self.tk_root, replay_speed, coalesce=False)
+            else:
+                self.gui = SolitaireGui(self.tk_root)
         self.render()
 
     def step(self, card, action):
         log.debug("*** step ***")
         self.steps_log.append((card, action))
+        if tracer.enabled:
+            zones_before = self.zone_sizes
+            self._step(card, action)
+            tracer.record(self, card, action, zones_before)
+        else:
+            self._step(card, action)
+
+    def _step(self, card, action):
         if action.startswith("system_"):
             getattr(self.engine, action)()
         elif "@" in action:  # action needs an indexed target
@@ -84,34 +80,29 @@ class MTGSolitaire:
 
     def render(self):
         log.debug("*** render ***")
-        log.info(f"Turn: {self.counter_turn}, Library: {len(self.library)}, Life: {self.counter_life}")
-        log.info(f"Hand: {len(self.hand)} {self.hand}")
-        log.info(f"Battlefield: {len(self.battlefield)} {self.battlefield}")
-        log.info(f"Lands: {len(self.lands)} {self.lands}")
-        log.info(f"Graveyard: {len(self.graveyard)} {self.graveyard}")
-        log.info(f"Exile: {len(self.exile)} {self.exile}")
-        log.info(f"Mana pool: {[f'{i} {self.mana_pool[i]}' for i in MANA_TYPES]}")
+        if log.isEnabledFor(logging.INFO):  # render runs for every new game
+            log.info(f"Turn: {self.counter_turn}, Library: {len(self.library)}, Life: {self.counter_life}")
+            log.info(f"Hand: {len(self.hand)} {self.hand}")
+            log.info(f"Battlefield: {len(self.battlefield)} {self.battlefield}")
+            log.info(f"Lands: {len(self.lands)} {self.lands}")
+            log.info(f"Graveyard: {len(self.graveyard)} {self.graveyard}")
+            log.info(f"Exile: {len(self.exile)} {self.exile}")
+            log.info(f"Mana pool: {[f'{i} {self.mana_pool[i]}' for i in MANA_TYPES]}")
         if not self.tk_root:
             return
-        # update GUI
-        if not self.engine.passing:
-            self.tk_root.title(
-                f"MTGO at home | "
-                f"Turn {self.counter_turn} (mine) | "
-                f"Life {self.counter_life} vs {self.opponent_counter_life}"
-            )
-        else:
-            self.tk_root.title(
-                f"MTGO at home | "
-                f"Turn {self.counter_turn} (opponent) | "
-                f"Life {self.counter_life} vs {self.opponent_counter_life}"
-            )
-        self.gui_battlefield.load_images(self)
-        self.gui_lands.load_images(self)
-        self.gui_hand.load_images(self)
-        self.gui_graveyard.load_images(self)
-        self.gui_exile.load_images(self)
-        self.gui_mana_pool.load_images(self)
+        # update GUI: render may run in the game thread, the GUI draws in the Tk main loop
+        self.gui.publish(self)
+
+    @property
+    def zone_sizes(self):
+        return {
+            "library": len(self.library),
+            "hand": len(self.hand),
+            "lands": len(self.lands),
+            "battlefield": len(self.battlefield),
+            "graveyard": len(self.graveyard),
+            "exile": len(self.exile),
+        }
 
     @property
     def functional_hash(self):
@@ -0,0 +1,72 @@
+import json
+from collections import deque
+
+from solitaire_spy.constants import TRACE_BUFFER_SIZE
+
+
+class TraceEvent:
+    __slots__ = ("turn", "card_id", "card", "action", "zone_deltas")
+
+    def __init__(self, turn, card_id, card, action, zone_deltas):
+        self.turn = turn
+        self.card_id = card_id
+        self.card = card
+        self.action = action
+        self.zone_deltas = zone_deltas
+
+    def as_dict(self):
+        return {
+            "turn": self.turn,
+            "card_id": self.card_id,
+            "card": self.card,
+            "action": self.action,
+            "zone_deltas": self.zone_deltas,
+        }
+
+    def __str__(self):
+        deltas = ", ".join(f"{k} {v:+d}" for k, v in self.zone_deltas.items())
+        return f"T{self.turn} {self.card} ({self.card_id}) -> {self.action} [{deltas}]"
+
+
+class TraceRecorder:
+    # Structured replacement for per-step logging: callers must check `enabled`
+    # before doing any work, so that a disabled recorder costs a single attribute read
+    def __init__(self, size=TRACE_BUFFER_SIZE):
+        self.enabled = False
+        self.events = deque(maxlen=size)
+
+    def enable(self, size=None):
+        if size is not None and size != self.events.maxlen:
+            self.events = deque(self.events, maxlen=size)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.events.clear()
+
+    def record(self, env, card, action, zones_before):
+        zones_after = env.zone_sizes
+        zone_deltas = {
+            zone: zones_after[zone] - zones_before[zone]
+            for zone in zones_after
+            if zones_after[zone] != zones_before[zone]
+        }
+        self.events.append(TraceEvent(
+            env.counter_turn,
+            id(card) if card else None,
+            card.name if card else None,
+            action,
+            zone_deltas,
+        ))
+
+    def dump(self, file_name=None):
+        events = [e.as_dict() for e in self.events]
+        if file_name:
+            with open(file_name, "w") as f:
+                json.dump(events, f, indent=2)
+        return events
+
+
+tracer = TraceRecorder()